@@ -14,6 +14,8 @@ if [ "$1" = "llama" ]; then
         --gpu-memory-utilization 0.8 \
         --dtype half \
         --served-model-name "$1" \
+        --enable-prefix-caching \
+        --enable-prompt-tokens-details \
         --host 0.0.0.0 \
         --port 8080
 fi
@@ -32,5 +34,7 @@ fi
 # “float32”表示 FP32 精度。
 # kv-cache-dtype	kv 缓存存储的数据类型。如果为“auto”，则将使用模型默认的数据类型。CUDA 11.8及以上版本 支持 fp8 （=fp8_e4m3） 和 fp8_e5m2。ROCm （AMD GPU） 支持 fp8 （=fp8_e4m3）
 # served-model-name	对外提供的API中的模型名称
+# enable-prefix-caching	开启前缀缓存，相同前缀（系统提示词、历史对话）的请求复用 KV Cache
+# enable-prompt-tokens-details	在 usage.prompt_tokens_details.cached_tokens 中返回命中缓存的 token 数，用于统计缓存命中率
 # host	监听的网络地址，0.0.0.0表示所有网卡的所有IP，127.0.0.1表示仅限本机
 # port	API服务的端口
@@ -8,7 +8,7 @@ from src import config
 from server.models import Base
 from server.models.user_model import User
 from server.models.thread_model import Thread
-from server.models.kb_models import KnowledgeDatabase, KnowledgeFile, KnowledgeNode
+from server.models.kb_models import KnowledgeDatabase, KnowledgeFile, KnowledgeNode, KnowledgeNodeEntity
 from src.utils import logger
 
 class DBManager:
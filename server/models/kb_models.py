@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, JSON, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, DateTime, JSON, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import time
@@ -87,8 +87,13 @@ class KnowledgeNode(Base):
     hash = Column(String, nullable=True)  # 文本哈希值
     start_char_idx = Column(Integer, nullable=True)  # 开始字符索引
     end_char_idx = Column(Integer, nullable=True)  # 结束字符索引
+    chunk_idx = Column(Integer, nullable=True)  # 块在文件中的序号，用于查找相邻的块
     meta_info = Column(JSON, nullable=True)  # 元数据
 
+    __table_args__ = (
+        Index("ix_knowledge_nodes_file_chunk", "file_id", "chunk_idx"),
+    )
+
     # 关系
     file = relationship("KnowledgeFile", back_populates="nodes")
 
@@ -101,5 +106,20 @@ class KnowledgeNode(Base):
             "hash": self.hash,
             "start_char_idx": self.start_char_idx,
             "end_char_idx": self.end_char_idx,
+            "chunk_idx": self.chunk_idx,
             "metadata": self.meta_info or {}  # 确保映射正确
         }
+
+class KnowledgeNodeEntity(Base):
+    """知识块中提及的图谱实体（实体 -> 知识块的倒排索引）"""
+    __tablename__ = 'knowledge_node_entities'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    database_id = Column(String, nullable=False)  # 所属数据库ID
+    file_id = Column(String, nullable=False, index=True)  # 所属文件ID
+    node_id = Column(Integer, ForeignKey('knowledge_nodes.id'), nullable=False, index=True)  # 知识块ID
+    entity = Column(String, nullable=False)  # 实体名称
+
+    __table_args__ = (
+        Index("ix_knowledge_node_entities_db_entity", "database_id", "entity"),
+    )
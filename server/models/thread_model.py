@@ -19,3 +19,16 @@ class Thread(Base):
 
     description = Column(String(255), nullable=True, comment="描述")
     status = Column(Integer, default=1, comment="状态")
+
+
+class ThreadMessage(Base):
+    """对话线程的消息表，服务端保存的历史记录"""
+    __tablename__ = "thread_message"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    thread_id = Column(String(64), ForeignKey("thread.id"), index=True, nullable=False, comment="线程ID")
+    role = Column(String(16), nullable=False, comment="角色：user / assistant / summary")
+    content = Column(Text, nullable=False, comment="消息内容")
+    token_count = Column(Integer, default=0, comment="消息的 token 数")
+    evicted = Column(Integer, default=0, comment="是否已被压缩进摘要")
+    create_at = Column(DateTime, default=func.now(), comment="创建时间")
@@ -1,7 +1,12 @@
-from fastapi import Request, Body, Depends
+from fastapi import Request, Body, Depends, Query
 from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
 
 from src import config, retriever, knowledge_base, graph_base
+from src.models import clear_model_cache
+from src.models.chat_model import response_cache
+from src.models.metrics import llm_metrics
+from src.models.load_balancer import get_endpoint_stats
 from server.utils.auth_middleware import get_admin_user, get_superadmin_user
 from server.models.user_model import User
 
@@ -30,6 +35,7 @@ async def update_config(
 ) -> dict:
     config[key] = value
     config.save()
+    clear_model_cache()
     return config.dump_config()
 
 @base.post("/config/update")
@@ -39,6 +45,7 @@ async def update_config_item(
 ) -> dict:
     config.update(items)
     config.save()
+    clear_model_cache()
     return config.dump_config()
 
 @base.post("/restart")
@@ -46,8 +53,24 @@ async def restart(current_user: User = Depends(get_superadmin_user)):
     knowledge_base.restart()
     graph_base.start()
     retriever.restart()
+    clear_model_cache()
     return {"message": "Restarted!"}
 
+@base.get("/admin/metrics")
+def get_metrics(format: str = Query("json"), current_user: User = Depends(get_admin_user)):
+    """各模型的调用次数、错误率、token 用量（含命中前缀缓存的比例）、延迟和输出速度
+
+    format=prometheus 时返回 Prometheus 文本格式
+    """
+    if format == "prometheus":
+        return PlainTextResponse(llm_metrics.to_prometheus(), media_type="text/plain; version=0.0.4")
+    return {"models": llm_metrics.summary(), "response_cache": response_cache.stats(), "endpoints": get_endpoint_stats()}
+
+@base.get("/llm_cache_stats")
+def get_llm_cache_stats(current_user: User = Depends(get_admin_user)):
+    """LLM 响应缓存的命中率和节省的 token 数"""
+    return response_cache.stats()
+
 @base.get("/log")
 def get_log(current_user: User = Depends(get_admin_user)):
     from src.utils.logging_config import LOG_FILE
@@ -1,5 +1,6 @@
 import os
 import json
+import orjson
 import asyncio
 import traceback
 import uuid
@@ -10,11 +11,13 @@ from langchain_core.messages import AIMessageChunk, HumanMessage
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 
-from src import executor, config, retriever
+from src import config, retriever
 from src.core import HistoryManager
+from src.core.history import ThreadHistory
 from src.agents import agent_manager
 from src.models import select_model
 from src.utils.logging_config import logger
+from src.utils.prompts import append_volatile, get_time_prompt
 from src.agents.tools_factory import get_all_tools
 from server.routers.auth_router import get_admin_user
 from server.utils.auth_middleware import get_required_user, get_db
@@ -68,6 +71,32 @@ async def chat_get(current_user: User = Depends(get_required_user)):
     """聊天服务健康检查（需要登录）"""
     return "Chat Get!"
 
+# 后台的历史摘要任务，保存引用以免被垃圾回收
+_background_tasks = set()
+
+
+def summarize_in_background(history_manager, model):
+    async def summarize():
+        try:
+            await history_manager.asummarize(model)
+        except Exception as e:
+            logger.error(f"Summarize history error: {e}, {traceback.format_exc()}")
+
+    task = asyncio.create_task(summarize())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def load_history_manager(thread_id, user_id, history, meta):
+    """指定 thread_id 时从服务端加载对话历史，否则使用请求中的 history"""
+    if not thread_id:
+        return HistoryManager(history, system_prompt=meta.get("system_prompt"))
+    try:
+        return await asyncio.to_thread(ThreadHistory, thread_id, user_id, system_prompt=meta.get("system_prompt"))
+    except PermissionError:
+        raise HTTPException(status_code=403, detail="无权访问该对话线程")
+
+
 @chat.post("/")
 async def chat_post(
         #  ...代表必填，None代表可选 
@@ -75,12 +104,20 @@ async def chat_post(
         meta: dict = Body(None),
         history: list[dict] | None = Body(None),
         thread_id: str | None = Body(None),
+        compact: bool = Body(False),
         current_user: User = Depends(get_required_user)):
-    """处理聊天请求的主要端点（需要登录）"""
+    """处理聊天请求的主要端点（需要登录）
+
+    compact=True 时使用紧凑的流式协议：meta 只在第一个数据块中发送一次，
+    之后的数据块只包含增量，reasoning_content 也是增量而不是累积的全文。
+
+    指定 thread_id 时使用服务端保存的对话历史，忽略请求中的 history，
+    结束时不再返回完整的 history，而是返回本轮的 token 数。
+    """
 
     model = select_model()
     meta["server_model_name"] = model.model_name
-    history_manager = HistoryManager(history, system_prompt=meta.get("system_prompt"))
+    history_manager = await load_history_manager(thread_id, current_user.id, history, meta)
     logger.debug(f"Received query: {query} with meta: {meta}")
 
     # 构造一条 JSON 格式的数据块（chunk），并编码成 字节串，末尾再加上一个换行符 b"\n"用于 流式响应
@@ -101,6 +138,12 @@ async def chat_post(
     #     "status": "loading"
     # }
     def make_chunk(content=None, **kwargs):
+        if compact:
+            chunk = {k: v for k, v in kwargs.items() if v is not None}
+            if content is not None:
+                chunk["response"] = content
+            return orjson.dumps(chunk, option=orjson.OPT_APPEND_NEWLINE)
+
         return json.dumps({
             "response": content,
             "meta": meta,
@@ -110,17 +153,21 @@ async def chat_post(
     def need_retrieve(meta):
         return meta.get("use_web") or meta.get("use_graph") or meta.get("db_id")
 
-    def generate_response():
+    async def generate_response():
         modified_query = query
         refs = None
 
+        if compact:
+            yield make_chunk(status="init", meta=meta)
+
         # 处理知识库检索
         if meta and need_retrieve(meta):
             chunk = make_chunk(status="searching")
             yield chunk
 
             try:
-                modified_query, refs = retriever(modified_query, history_manager.messages, meta)
+                modified_query, refs = await retriever.acall(modified_query, history_manager.messages, meta,
+                                                             prefetch_key=current_user.id)
             except Exception as e:
                 logger.error(f"Retriever error: {e}, {traceback.format_exc()}")
                 yield make_chunk(message=f"Retriever error: {e}", status="error")
@@ -128,17 +175,22 @@ async def chat_post(
 
             yield make_chunk(status="generating")
 
-        messages = history_manager.get_history_with_msg(modified_query, max_rounds=meta.get('history_round'))
+        messages = history_manager.get_history_with_msg(modified_query,
+                                                        max_rounds=meta.get('history_round'),
+                                                        max_tokens=config.history_max_tokens)
+        # 当前时间等易变内容放在最后，保证前面的消息可以命中推理服务的前缀缓存
+        messages = append_volatile(messages, get_time_prompt())
         history_manager.add_user(query)  # 注意这里使用原始查询
 
         content = ""
         reasoning_content = ""
         try:
-            for delta in model.predict(messages, stream=True):
+            async for delta in model.astream(messages):
                 # 推理模型才会有reasoning_content属性
                 if not delta.content and hasattr(delta, 'reasoning_content'):
                     reasoning_content += delta.reasoning_content or ""
-                    chunk = make_chunk(reasoning_content=reasoning_content, status="reasoning")
+                    chunk = make_chunk(reasoning_content=delta.reasoning_content if compact else reasoning_content,
+                                       status="reasoning")
                     yield chunk
                     continue
 
@@ -153,9 +205,19 @@ async def chat_post(
 
             logger.debug(f"Final response: {content}")
             logger.debug(f"Final reasoning response: {reasoning_content}")
-            yield make_chunk(status="finished",
-                            history=history_manager.update_ai(content),
-                            refs=refs)
+            if thread_id:
+                usage = await asyncio.to_thread(history_manager.save_turn, query, content)
+                if config.history_summary:
+                    summarize_in_background(history_manager, model)
+                yield make_chunk(status="finished", usage=usage, refs=refs)
+            else:
+                yield make_chunk(status="finished",
+                                history=history_manager.update_ai(content),
+                                refs=refs)
+        except asyncio.CancelledError:
+            # 客户端断开连接，astream 会关闭上游的流式请求
+            logger.info(f"Client disconnected, stop generating: {query}")
+            raise
         except Exception as e:
             logger.error(f"Model error: {e}, {traceback.format_exc()}")
             yield make_chunk(message=f"Model error: {e}", status="error")
@@ -163,16 +225,39 @@ async def chat_post(
 
     return StreamingResponse(generate_response(), media_type='application/json')
 
+@chat.post("/prefetch")
+async def chat_prefetch(
+        query: str = Body(...),
+        meta: dict = Body(None),
+        history: list[dict] | None = Body(None),
+        thread_id: str | None = Body(None),
+        current_user: User = Depends(get_required_user)):
+    """用户输入过程中预先检索知识库（需要登录）
+
+    预热查询向量和检索结果的缓存；发送的问题与草稿足够接近时，/chat/ 会直接复用预检索的结果。
+    """
+    meta = meta or {}
+    history_manager = await load_history_manager(thread_id, current_user.id, history, meta)
+
+    task = await retriever.aprefetch(current_user.id, query, history_manager.messages, meta)
+    if task is None:
+        # disabled 表示全局关闭了预检索，客户端之后不再发送；skipped 只针对这一次草稿（比如未选择知识库）
+        return {"status": "disabled" if not config.enable_prefetch else "skipped"}
+
+    await asyncio.wait({task})
+    if task.cancelled():
+        return {"status": "cancelled"}
+    if task.exception():
+        logger.error(f"Prefetch error: {task.exception()}")
+        return {"status": "failed", "message": str(task.exception())}
+    return {"status": "success", "count": len(task.result()["results"])}
+
 @chat.post("/call")
 async def call(query: str = Body(...), meta: dict = Body(None), current_user: User = Depends(get_required_user)):
     """调用模型进行简单问答（需要登录）"""
     meta = meta or {}
     model = select_model(model_provider=meta.get("model_provider"), model_name=meta.get("model_name"))
-    async def predict_async(query):
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(executor, model.predict, query)
-
-    response = await predict_async(query)
+    response = await model.apredict(query, cache=meta.get("cache", False))
     logger.debug({"query": query, "response": response.content})
 
     return {"response": response.content}
@@ -44,9 +44,10 @@ async def create_database(
     database_name: str = Body(...),
     description: str = Body(...),
     dimension: int | None = Body(None),
+    vector_precision: str | None = Body(None),
     current_user: User = Depends(get_admin_user)
 ):
-    logger.debug(f"Create database {database_name}")
+    logger.debug(f"Create database {database_name} with vector precision {vector_precision}")
     try:
         existing_dbs_dict = knowledge_base.get_databases()  
         db_list = existing_dbs_dict.get("databases", [])  
@@ -58,7 +59,8 @@ async def create_database(
         database_info = knowledge_base.create_database(
             database_name,
             description,
-            dimension=dimension
+            dimension=dimension,
+            vector_precision=vector_precision
         )
     except HTTPException:
         raise
@@ -133,7 +135,8 @@ async def delete_database(db_id, current_user: User = Depends(get_admin_user)):
 @data.post("/query-test")
 async def query_test(query: str = Body(...), meta: dict = Body(...), current_user: User = Depends(get_admin_user)):
     logger.debug(f"Query test in {meta}: {query}")
-    result = retriever.query_knowledgebase(query, history=None, refs={"meta": meta})
+    # 检索与重排序都是阻塞调用，放到线程池中执行，避免阻塞事件循环
+    result = await asyncio.to_thread(retriever.query_knowledgebase, query, history=None, refs={"meta": meta})
     return result
 
 @data.post("/file-to-chunk")
@@ -174,6 +177,15 @@ async def index_file(db_id: str = Body(...), file_id: str = Body(...), current_u
         logger.error(f"Failed to index file {file_id}: {e}, {traceback.format_exc()}")
         return {"message": f"Failed to index file {file_id}: {e}", "status": "failed"}
 
+@data.post("/entity-index")
+async def rebuild_entity_index(db_id: str = Body(..., embed=True), current_user: User = Depends(get_admin_user)):
+    """图谱导入新的实体后，重建知识库中知识块与实体的关联"""
+    try:
+        count = await asyncio.to_thread(knowledge_base.rebuild_entity_index, db_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": f"已为知识库 {db_id} 写入 {count} 条实体索引", "count": count, "status": "success"}
+
 @data.get("/info")
 async def get_database_info(db_id: str, current_user: User = Depends(get_admin_user)):
     # logger.debug(f"Get database {db_id} info")
@@ -241,7 +253,7 @@ async def index_nodes(data: dict = Body(default={}), current_user: User = Depend
     kgdb_name = data.get('kgdb_name', 'neo4j')
 
     # 调用GraphDatabase的add_embedding_to_nodes方法
-    count = graph_base.add_embedding_to_nodes(kgdb_name=kgdb_name)
+    count = await graph_base.add_embedding_to_nodes(kgdb_name=kgdb_name)
 
     return {"status": "success", "message": f"已成功为{count}个节点添加嵌入向量", "indexed_count": count}
 
@@ -11,8 +11,8 @@ config = Config()
 from src.core import KnowledgeBase  # noqa: E402
 knowledge_base = KnowledgeBase()
 
-from src.core import GraphDatabase  # noqa: E402
-graph_base = GraphDatabase()
+from src.core import create_graph_database  # noqa: E402
+graph_base = create_graph_database()
 
 from src.core.retriever import Retriever  # noqa: E402
 retriever = Retriever()
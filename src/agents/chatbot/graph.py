@@ -16,6 +16,7 @@ from src.agents.registry import State, BaseAgent
 from src.agents.utils import load_chat_model, get_cur_time_with_utc
 from src.agents.chatbot.configuration import ChatbotConfiguration
 from src.agents.tools_factory import get_all_tools
+from src.utils.prompts import append_volatile
 
 class ChatbotAgent(BaseAgent):
     name = "chatbot"
@@ -49,13 +50,13 @@ class ChatbotAgent(BaseAgent):
         """调用 llm 模型"""
         conf = self.config_schema.from_runnable_config(config, agent_name=self.name)
 
-        system_prompt = f"{conf.system_prompt} Now is {get_cur_time_with_utc()}"
         model = load_chat_model(conf.model)
         model_with_tools = model.bind_tools(self._get_tools(conf.tools))
 
-        res = model_with_tools.invoke(
-            [{"role": "system", "content": system_prompt}, *state["messages"]]
-        )
+        # 系统提示词和工具定义保持不变以命中前缀缓存，当前时间放在消息的最后
+        messages = append_volatile([{"role": "system", "content": conf.system_prompt}, *state["messages"]],
+                                   f"Now is {get_cur_time_with_utc()}")
+        res = model_with_tools.invoke(messages)
         return {"messages": [res]}
 
     async def get_graph(self, config_schema: RunnableConfig = None, **kwargs):
@@ -141,7 +141,11 @@ def calculator(a: float, b: float, operation: str) -> float:
 @tool
 def query_knowledge_graph(query: Annotated[str, "The keyword to query knowledge graph."]):
     """Use this to query knowledge graph."""
-    return graph_base.query_node(query, hops=2)
+    graph = graph_base.format_query_result_to_graph(graph_base.query_node(query, hops=2))
+    # 与检索增强时拼接到提示词中的图数据库信息格式一致，每条关系一行
+    relations = dict.fromkeys(f"{edge['source_name']}和{edge['target_name']}的关系是{edge['type']}"
+                              for edge in graph["edges"])
+    return "\n".join(relations)
 
 
 
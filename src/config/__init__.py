@@ -158,6 +158,25 @@ class Config(SimpleConfig):
         self.add_item("model_local_paths", default={}, des="本地模型路径")
         self.add_item("use_rewrite_query", default="on", des="重写查询", choices=["off", "on", "hyde"])
         self.add_item("device", default="cuda", des="运行本地模型的设备", choices=["cpu", "cuda"])
+        self.add_item("reranker_precision", default="auto", des="本地重排序模型的推理精度（auto: cuda 使用 fp16，cpu 使用 fp32）", choices=["auto", "fp32", "fp16", "int8"])  # noqa: E501
+        self.add_item("reranker_batch_size", default=32, des="本地重排序模型的推理批大小")
+        self.add_item("reranker_max_length", default=512, des="重排序时 query + passage 的最大 token 长度")
+        self.add_item("reranker_latency_budget", default=3.0, des="远程重排序的耗时预算（秒），超时则保持向量检索的顺序")
+        self.add_item("history_max_tokens", default=6000, des="对话历史的最大 token 数，超出的部分会被移出上下文窗口")
+        self.add_item("history_summary", default=True, des="是否将移出上下文窗口的对话总结为摘要（仅对服务端保存的对话线程生效）")
+        self.add_item("enable_prefetch", default=True, des="是否在用户输入停顿时预检索知识库（预检索不改写草稿，开启查询改写时只有改写后的问题与草稿足够接近才复用）")  # noqa: E501
+        self.add_item("context_max_tokens", default=3000, des="参考资料（知识库、图数据库、网络搜索）的最大 token 数，0 表示不限制")
+        self.add_item("context_extract_sentences", default=False, des="是否只保留检索结果中与问题相关的句子")
+        self.add_item("llm_cache_backend", default="memory", des="LLM 响应缓存的存储方式（仅用于改写查询、实体识别等可复用的调用）", choices=["memory", "disk"])  # noqa: E501
+        self.add_item("llm_cache_ttl", default=3600, des="LLM 响应缓存的过期时间（秒）")
+        self.add_item("graph_backend", default="neo4j", des="图数据库后端（embedded 为进程内的嵌入式存储，不需要 Neo4j，修改后需要重启）", choices=["neo4j", "embedded"])  # noqa: E501
+        self.add_item("graph_import_batch_size", default=5000, des="导入图数据库时每个事务写入的三元组数量")
+        self.add_item("graph_max_fanout", default=50, des="图谱检索时每个节点每一跳最多展开的关系数量")
+        self.add_item("graph_traversal", default="cypher", des="图谱多跳检索的实现方式（apoc 需要 Neo4j 安装 APOC 插件，不可用时回退到 cypher）", choices=["cypher", "apoc"])  # noqa: E501
+        self.add_item("neo4j_max_connection_pool_size", default=100, des="Neo4j 驱动连接池的最大连接数")
+        self.add_item("neo4j_connection_acquisition_timeout", default=60.0, des="从 Neo4j 连接池获取连接的超时时间（秒）")
+        self.add_item("graph_chunk_expansion", default=False, des="是否将图谱检索命中的实体展开为提及它们的知识块，并按实体重合程度调整知识库检索结果的排序")  # noqa: E501
+        self.add_item("graph_chunk_boost", default=0.2, des="图谱展开检索中，与命中实体重合程度最高的知识块的分数增量")
         ### <<< 默认配置结束
 
         self.load()
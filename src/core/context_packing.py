@@ -0,0 +1,137 @@
+"""
+检索结果的上下文压缩
+
+生成之前对知识库的检索结果进行整理，减少输入 LLM 的 token 数：
+1. 去重：文本相同的块只保留分数最高的一个
+2. 合并：同一文件中相邻（chunk_idx 连续）的块合并为一段，去掉块之间 chunk_overlap 造成的重复文本
+3. 按分数在 token 预算内选择段落
+4. 可选：只保留段落中与问题相关的句子
+"""
+
+import re
+
+from src.core.history import count_tokens
+
+_SENTENCE_PATTERN = re.compile(r"[^。！？；!?;\n]+[。！？；!?;\n]*")
+
+
+def get_score(result):
+    """重排序分数优先，否则使用向量相似度"""
+    return result.get("rerank_score", result.get("distance", 0.0))
+
+
+def merge_overlap(left, right, left_end=None, right_start=None):
+    """拼接同一文件中相邻的两个文本块，去掉 chunk_overlap 造成的重复文本
+
+    重叠的长度由块在原文中的字符位置计算（left 的结束位置 - right 的开始位置）。缺少位置或位置与文本不一致时直接拼接，
+    不按文本猜测重叠，以免误删结尾与开头恰好相同（如相同的标点、助词）但并不重复的字符。
+    """
+    if left_end is None or right_start is None:
+        return left + right
+    overlap = left_end - right_start
+    if 0 < overlap <= min(len(left), len(right)) and left.endswith(right[:overlap]):
+        return left + right[overlap:]
+    return left + right
+
+
+def dedup_results(results):
+    """文本相同的块只保留分数最高的一个"""
+    best = {}
+    for r in results:
+        text = r["entity"].get("text", "")
+        if text and (text not in best or get_score(r) > get_score(best[text])):
+            best[text] = r
+    return list(best.values())
+
+
+def merge_adjacent(results):
+    """将同一文件中 chunk_idx 连续的块合并为段落
+
+    Returns:
+        list[dict]: 段落 {"id", "file_id", "text", "score", "ids"}，score 为其中分数最高的块的分数
+    """
+    grouped, passages = {}, []
+    for r in results:
+        entity = r["entity"]
+        if entity.get("file_id") is None or entity.get("chunk_idx") is None:
+            passages.append({"id": r["id"], "file_id": entity.get("file_id"), "text": entity.get("text", ""),
+                             "score": get_score(r), "ids": [r["id"]]})
+        else:
+            grouped.setdefault(entity["file_id"], []).append(r)
+
+    for file_id, chunks in grouped.items():
+        chunks.sort(key=lambda r: r["entity"]["chunk_idx"])
+        current, last_idx, last_end = None, None, None
+        for r in chunks:
+            chunk_idx = r["entity"]["chunk_idx"]
+            if current is not None and chunk_idx - last_idx <= 1:
+                current["text"] = merge_overlap(current["text"], r["entity"]["text"],
+                                                last_end, r["entity"].get("start_char_idx"))
+                current["score"] = max(current["score"], get_score(r))
+                current["ids"].append(r["id"])
+            else:
+                current = {"id": r["id"], "file_id": file_id, "text": r["entity"]["text"],
+                           "score": get_score(r), "ids": [r["id"]]}
+                passages.append(current)
+            last_idx, last_end = chunk_idx, r["entity"].get("end_char_idx")
+
+    return passages
+
+
+def _bigrams(text):
+    text = re.sub(r"\s+", "", text.lower())
+    return {text[i:i + 2] for i in range(len(text) - 1)} or ({text} if text else set())
+
+
+def extract_relevant_sentences(text, query, min_overlap=0.1):
+    """只保留与问题有字符二元组重叠的句子，保持原有的顺序；没有相关句子时保留最相关的一句"""
+    sentences = [s for s in _SENTENCE_PATTERN.findall(text) if s.strip()]
+    query_bigrams = _bigrams(query)
+    if len(sentences) <= 1 or not query_bigrams:
+        return text
+
+    scores = [len(_bigrams(s) & query_bigrams) / len(query_bigrams) for s in sentences]
+    kept = [s for s, score in zip(sentences, scores) if score >= min_overlap]
+    if not kept:
+        kept = [sentences[max(range(len(sentences)), key=scores.__getitem__)]]
+    return "".join(kept).strip()
+
+
+def select_by_budget(items, max_tokens, key="text"):
+    """按分数从高到低选择，跳过放不进剩余预算的条目
+
+    Returns:
+        (selected, used_tokens)
+    """
+    selected, used = [], 0
+    for item in sorted(items, key=lambda x: x.get("score", 0.0), reverse=True):
+        tokens = count_tokens(item[key])
+        if used + tokens > max_tokens:
+            continue
+        selected.append(item)
+        used += tokens
+    return selected, used
+
+
+def pack_knowledge_base(results, query, max_tokens=None, extract_sentences=False):
+    """整理知识库的检索结果
+
+    Args:
+        results: KnowledgeBase.query 返回的 results
+        query: 用户的问题，用于抽取相关的句子
+        max_tokens: token 预算，None 或 0 表示不限制
+        extract_sentences: 是否只保留与问题相关的句子
+
+    Returns:
+        (passages, used_tokens): 按分数从高到低排列的段落
+    """
+    passages = merge_adjacent(dedup_results(results))
+    if extract_sentences:
+        for passage in passages:
+            passage["text"] = extract_relevant_sentences(passage["text"], query)
+
+    if not max_tokens:
+        passages.sort(key=lambda x: x["score"], reverse=True)
+        return passages, sum(count_tokens(p["text"]) for p in passages)
+
+    return select_by_budget(passages, max_tokens)
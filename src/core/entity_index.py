@@ -0,0 +1,98 @@
+"""
+知识块与图谱实体的关联
+
+入库时用图谱中的实体名对知识块做词典匹配，记录每个知识块提及的实体（实体 -> 知识块的倒排索引，
+保存在 knowledge_node_entities 表中）。检索时将图谱检索命中的实体展开为提及它们的知识块，
+并按知识块与这些实体的重合程度提升排序，整个过程不需要额外调用 LLM。
+"""
+
+from src.core.context_packing import get_score
+
+# 过短的实体名（单个字、字母）在文本中大量误匹配，不参与索引
+MIN_ENTITY_LENGTH = 2
+
+
+class EntityMatcher:
+    """按实体名长度分组的词典匹配
+
+    对每个出现过的长度在文本上滑动窗口查表，复杂度为 O(文本长度 × 不同长度的数量)，
+    与实体数量无关；中文文本没有分词边界，所以按子串匹配。
+    """
+
+    def __init__(self, names, min_length=MIN_ENTITY_LENGTH):
+        self.by_length = {}
+        for name in names:
+            if name and len(name) >= min_length:
+                self.by_length.setdefault(len(name), set()).add(name)
+        self.lengths = sorted(self.by_length)
+
+    def __len__(self):
+        return sum(len(names) for names in self.by_length.values())
+
+    def match(self, text):
+        """返回文本中出现的实体名集合"""
+        found = set()
+        if not text:
+            return found
+
+        for length in self.lengths:
+            if length > len(text):
+                break
+            names = self.by_length[length]
+            for i in range(len(text) - length + 1):
+                if text[i:i + length] in names:
+                    found.add(text[i:i + length])
+        return found
+
+
+def entity_weights(query_entities, graph_entities, neighbor_weight=0.5):
+    """问题中的实体权重为 1，图谱检索展开得到的其他实体权重为 neighbor_weight"""
+    weights = dict.fromkeys(graph_entities, neighbor_weight)
+    weights.update(dict.fromkeys(query_entities, 1.0))
+    return weights
+
+
+def rank_by_entity_overlap(results, node_entities, weights, boost=0.2, extra=None, max_extra=5):
+    """按实体重合程度调整知识库的检索结果
+
+    Args:
+        results: 向量检索的结果，id 为知识块 id；合并相邻块后的结果通过 hit_ids 关联多个知识块
+        node_entities: {知识块 id: 提及的实体集合}
+        weights: {实体名: 权重}
+        boost: 重合程度最高的知识块的分数增量，其余按比例缩放
+        extra: {知识块 id: 检索结果}，未被向量检索命中、由实体展开得到的知识块
+        max_extra: 最多加入的展开知识块数量
+
+    Returns:
+        list[dict]: 按调整后的分数从高到低排序的结果，结果中的 entity_overlap 为提及的实体及重合分数
+    """
+    def overlap(node_ids):
+        entities = set().union(*(node_entities.get(node_id, ()) for node_id in node_ids))
+        return sorted(entities), sum(weights.get(name, 0.0) for name in entities)
+
+    scored = [(r, *overlap(r.get("hit_ids") or [r["id"]])) for r in results]
+    candidates = sorted(((r, *overlap([node_id])) for node_id, r in (extra or {}).items()),
+                        key=lambda item: item[2], reverse=True)[:max_extra]
+    max_overlap = max((score for _, _, score in scored + candidates), default=0.0)
+    if max_overlap <= 0:
+        return results
+
+    # 展开得到的知识块以向量检索结果中的最低分为基准，重合程度相同时排在向量检索命中的知识块之后
+    floor = min((get_score(r) for r in results), default=0.0)
+    ranked = []
+    for r, entities, score in scored:
+        bonus = boost * score / max_overlap
+        ranked.append({**r, **_boosted(r, bonus), "entity_overlap": {"entities": entities, "score": score}})
+    for r, entities, score in candidates:
+        if score > 0:
+            bonus = boost * score / max_overlap
+            ranked.append({**r, "distance": floor + bonus, "entity_overlap": {"entities": entities, "score": score}})
+
+    ranked.sort(key=get_score, reverse=True)
+    return ranked
+
+
+def _boosted(result, bonus):
+    if "rerank_score" in result:
+        return {"rerank_score": result["rerank_score"] + bonus}
+    return {"distance": result.get("distance", 0.0) + bonus}
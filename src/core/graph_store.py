@@ -0,0 +1,520 @@
+"""
+嵌入式图存储，不依赖 Neo4j 的图数据库后端（config.graph_backend = "embedded"）
+
+图谱检索只用到实体名查找、实体向量 top-k 和 1~2 跳展开，规模不大时可以直接在进程内完成，
+适用于边缘部署和测试。数据保存在 saves/knowledge_graph/<kgdb_name>/embedded 下：
+- entities.json: 实体名列表，下标即实体 id，加载时构建 实体名 → id 的 dict
+- relation_types.json: 关系名列表
+- edge_src.npy / edge_dst.npy / edge_type.npy: 三元组
+- indptr.npy / indices.npy / edge_ids.npy: CSR 格式的无向邻接表，以内存映射方式读取
+- embeddings.npy / has_embedding.npy: 归一化后的实体向量矩阵，容量不足时倍增
+"""
+
+import os
+import json
+import time
+import atexit
+import shutil
+import threading
+from itertools import islice
+
+import numpy as np
+
+from src import config
+from src.utils import logger
+from src.core.graphbase import GraphDatabase, Node, Relationship
+
+
+class EmbeddedGraphStore:
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.RLock()
+        self._load()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _load_json(self, name):
+        if not os.path.exists(self._file(name)):
+            return []
+        with open(self._file(name), encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_json(self, name, data):
+        tmp_path = self._file(f"{name}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self._file(name))
+
+    def _load_array(self, name, dtype, mode="r"):
+        path = self._file(f"{name}.npy")
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return np.empty(0, dtype=dtype)
+        array = np.load(path, mmap_mode=mode)
+        return array if array.size else np.asarray(array)
+
+    def _save_array(self, name, array):
+        """先写临时文件再替换，已经打开的内存映射不受影响"""
+        path = self._file(f"{name}.npy")
+        tmp_path = self._file(f"{name}.tmp.npy")
+        np.save(tmp_path, array)
+        os.replace(tmp_path, path)
+        return self._load_array(name, array.dtype)
+
+    def _load(self):
+        self.names = self._load_json("entities.json")
+        self.name_index = {name: i for i, name in enumerate(self.names) if name is not None}
+        self.rel_types = self._load_json("relation_types.json")
+        self.rel_type_index = {name: i for i, name in enumerate(self.rel_types)}
+
+        self.edge_src = self._load_array("edge_src", np.int32)
+        self.edge_dst = self._load_array("edge_dst", np.int32)
+        self.edge_type = self._load_array("edge_type", np.int32)
+        self._edge_keys = set(zip(self.edge_src.tolist(), self.edge_dst.tolist(), self.edge_type.tolist()))
+
+        self.indptr = self._load_array("indptr", np.int64)
+        self.indices = self._load_array("indices", np.int32)
+        self.edge_ids = self._load_array("edge_ids", np.int32)
+        if len(self.indptr) != len(self.names) + 1:
+            self._build_csr()
+
+        # 新增的关系和删除的实体先记录在内存中，flush 时一次性写入文件并重建 CSR，
+        # 避免分批导入、逐个删除时每批都重写全部数组
+        self._pending_edges = ([], [], [])
+        self._removed_nodes = set()
+        self._dirty = False
+
+        self.embeddings = None
+        self.has_embedding = None
+        if os.path.exists(self._file("embeddings.npy")):
+            self.embeddings = np.load(self._file("embeddings.npy"), mmap_mode="r+")
+            self.has_embedding = np.load(self._file("has_embedding.npy"), mmap_mode="r+")
+
+        logger.info(f"Loaded embedded graph from {self.path}: {len(self.name_index)} entities, {len(self.edge_src)} edges")
+
+    def _build_csr(self):
+        num_nodes, num_edges = len(self.names), len(self.edge_src)
+        src = np.concatenate([self.edge_src, self.edge_dst]).astype(np.int64)
+        neighbors = np.concatenate([self.edge_dst, self.edge_src]).astype(np.int32)
+        edge_ids = np.concatenate([np.arange(num_edges, dtype=np.int32)] * 2)
+
+        order = np.argsort(src, kind="stable")
+        indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=num_nodes), out=indptr[1:])
+
+        self.indptr = self._save_array("indptr", indptr)
+        self.indices = self._save_array("indices", neighbors[order])
+        self.edge_ids = self._save_array("edge_ids", edge_ids[order])
+
+    def _get_or_add_node(self, name):
+        node_id = self.name_index.get(name)
+        if node_id is None:
+            node_id = self.name_index[name] = len(self.names)
+            self.names.append(name)
+        return node_id
+
+    def _get_or_add_rel_type(self, rel_type):
+        type_id = self.rel_type_index.get(rel_type)
+        if type_id is None:
+            type_id = self.rel_type_index[rel_type] = len(self.rel_types)
+            self.rel_types.append(rel_type)
+        return type_id
+
+    def add_triples(self, rows):
+        """添加三元组 {"h", "r", "t"}，已存在的三元组会被跳过，返回新增的数量
+
+        新增的数据在 flush 之前只保存在内存中，查询前会自动 flush。
+        """
+        with self._lock:
+            src, dst, types = self._pending_edges
+            added = 0
+            for row in rows:
+                key = (self._get_or_add_node(row["h"]), self._get_or_add_node(row["t"]),
+                       self._get_or_add_rel_type(row["r"]))
+                if key not in self._edge_keys:
+                    self._edge_keys.add(key)
+                    src.append(key[0])
+                    dst.append(key[1])
+                    types.append(key[2])
+                    added += 1
+            self._dirty = True
+            return added
+
+    def flush(self):
+        """将内存中新增的三元组和删除的实体写入文件，并重建 CSR"""
+        with self._lock:
+            if not self._dirty:
+                return
+
+            self._save_json("entities.json", self.names)
+            self._save_json("relation_types.json", self.rel_types)
+
+            src, dst, types = self._pending_edges
+            edge_src = np.concatenate([self.edge_src, np.asarray(src, dtype=np.int32)])
+            edge_dst = np.concatenate([self.edge_dst, np.asarray(dst, dtype=np.int32)])
+            edge_type = np.concatenate([self.edge_type, np.asarray(types, dtype=np.int32)])
+            if self._removed_nodes:
+                removed = np.asarray(list(self._removed_nodes), dtype=np.int32)
+                keep = ~np.isin(edge_src, removed) & ~np.isin(edge_dst, removed)
+                edge_src, edge_dst, edge_type = edge_src[keep], edge_dst[keep], edge_type[keep]
+
+            self.edge_src = self._save_array("edge_src", edge_src)
+            self.edge_dst = self._save_array("edge_dst", edge_dst)
+            self.edge_type = self._save_array("edge_type", edge_type)
+            self._build_csr()
+
+            if self._removed_nodes:
+                self._edge_keys = set(zip(self.edge_src.tolist(), self.edge_dst.tolist(), self.edge_type.tolist()))
+            self._pending_edges = ([], [], [])
+            self._removed_nodes = set()
+            self._dirty = False
+
+    def _ensure_capacity(self, num_nodes, dim):
+        if self.embeddings is not None and self.embeddings.shape[1] != dim:
+            raise ValueError(f"Embedding dimension mismatch: {self.embeddings.shape[1]} != {dim}")
+        if self.embeddings is not None and self.embeddings.shape[0] >= num_nodes:
+            return
+
+        old = 0 if self.embeddings is None else self.embeddings.shape[0]
+        capacity = max(num_nodes, old * 2, 1024)
+        for name, shape, dtype in (("embeddings", (capacity, dim), np.float32), ("has_embedding", (capacity,), np.bool_)):
+            tmp_path = self._file(f"{name}.tmp.npy")
+            array = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=dtype, shape=shape)
+            if old:
+                array[:old] = getattr(self, name)[:old]
+            array.flush()
+            del array
+            os.replace(tmp_path, self._file(f"{name}.npy"))
+            setattr(self, name, np.load(self._file(f"{name}.npy"), mmap_mode="r+"))
+
+    def set_embeddings(self, rows):
+        """写入实体向量，rows 为 [{"name", "embedding"}]"""
+        with self._lock:
+            rows = [(self.name_index[row["name"]], row["embedding"]) for row in rows if row["name"] in self.name_index]
+            if not rows:
+                return 0
+
+            ids = np.asarray([node_id for node_id, _ in rows])
+            vectors = normalize(np.asarray([embedding for _, embedding in rows], dtype=np.float32))
+            self._ensure_capacity(len(self.names), vectors.shape[1])
+            self.embeddings[ids] = vectors
+            self.has_embedding[ids] = True
+            self.embeddings.flush()
+            self.has_embedding.flush()
+            return len(rows)
+
+    def nodes_without_embedding(self, names=None):
+        with self._lock:
+            if names is None:
+                ids = np.asarray(list(self.name_index.values()), dtype=np.int64)
+            else:
+                ids = np.asarray([self.name_index[name] for name in names if name in self.name_index], dtype=np.int64)
+            if ids.size and self.has_embedding is not None:
+                embedded = np.zeros(len(ids), dtype=bool)
+                in_range = ids < len(self.has_embedding)
+                embedded[in_range] = self.has_embedding[ids[in_range]]
+                ids = ids[~embedded]
+            return [self.names[i] for i in ids.tolist()]
+
+    def search(self, vectors, top_k=5, threshold=0.0):
+        """每个向量取最相似的 top_k 个实体中相似度高于 threshold 的，返回去重后的实体 id"""
+        with self._lock:
+            if self.embeddings is None or not len(self.names):
+                return []
+            num_nodes = min(len(self.names), self.embeddings.shape[0])
+            embeddings, mask = self.embeddings[:num_nodes], self.has_embedding[:num_nodes]
+
+        # 与 Neo4j 向量索引的 cosine 分数一致：(1 + cos) / 2
+        scores = (1 + normalize(np.asarray(vectors, dtype=np.float32)) @ embeddings.T) / 2
+        scores[:, ~mask] = -np.inf
+        k = min(int(top_k), num_nodes)
+
+        seeds = {}
+        for row in scores:
+            for node_id in np.argpartition(-row, k - 1)[:k]:
+                if row[node_id] > threshold:
+                    seeds.setdefault(int(node_id), None)
+        return list(seeds)
+
+    def find_nodes(self, keyword, limit=10):
+        """实体名包含 keyword 的实体 id，最多 limit 个"""
+        with self._lock:
+            matched = (i for i, name in enumerate(self.names) if name is not None and keyword in name)
+            return list(islice(matched, int(limit)))
+
+    def nodes_with_rel_type(self, rel_type):
+        """作为起点出现在 rel_type 关系中的实体 id"""
+        with self._lock:
+            self.flush()
+            type_id = self.rel_type_index.get(rel_type)
+            if type_id is None:
+                return []
+            return np.unique(self.edge_src[self.edge_type == type_id]).tolist()
+
+    def expand(self, seeds, hops=2, max_fanout=50, rel_types=None, limit=1000, directed=False):
+        """从 seeds 出发按广度优先展开 hops 跳，每个节点最多展开 max_fanout 条关系，每个节点只访问一次
+
+        Returns:
+            list[int]: 去重后的关系 id
+        """
+        with self._lock:
+            self.flush()
+            indptr, indices, edge_ids = self.indptr, self.indices, self.edge_ids
+            edge_src, edge_type = self.edge_src, self.edge_type
+            allowed = None if not rel_types else {self.rel_type_index[t] for t in rel_types if t in self.rel_type_index}
+
+        visited, frontier = set(seeds), list(seeds)
+        edges, seen_edges = [], set()
+        for _ in range(max(int(hops), 1)):
+            next_frontier = []
+            for node_id in frontier:
+                if node_id + 1 >= len(indptr):
+                    continue
+                start, end = int(indptr[node_id]), int(indptr[node_id + 1])
+                taken = 0
+                for neighbor, edge_id in zip(indices[start:end].tolist(), edge_ids[start:end].tolist()):
+                    if taken >= max_fanout:
+                        break
+                    if allowed is not None and edge_type[edge_id] not in allowed:
+                        continue
+                    if directed and edge_src[edge_id] != node_id:
+                        continue
+                    taken += 1
+                    if edge_id not in seen_edges:
+                        seen_edges.add(edge_id)
+                        edges.append(edge_id)
+                        if len(edges) >= limit:
+                            return edges
+                    if neighbor not in visited:
+                        visited.add(neighbor)
+                        next_frontier.append(neighbor)
+            frontier = next_frontier
+        return edges
+
+    def triples(self, edge_ids):
+        """将关系 id 转换为 [start_node, relationship, end_node]"""
+        with self._lock:
+            self.flush()
+            results = []
+            for edge_id in edge_ids:
+                src, dst = int(self.edge_src[edge_id]), int(self.edge_dst[edge_id])
+                start = Node(f"embedded:node:{src}", self.names[src])
+                end = Node(f"embedded:node:{dst}", self.names[dst])
+                relationship = Relationship(f"embedded:edge:{edge_id}", "RELATION", start, end,
+                                            {"type": self.rel_types[int(self.edge_type[edge_id])]})
+                results.append([start, relationship, end])
+            return results
+
+    def delete(self, name=None):
+        """删除指定实体及其关系，name 为空则删除全部数据"""
+        with self._lock:
+            if name is None:
+                shutil.rmtree(self.path, ignore_errors=True)
+                os.makedirs(self.path, exist_ok=True)
+                self._load()
+                return
+
+            node_id = self.name_index.pop(name, None)
+            if node_id is None:
+                return
+            self.names[node_id] = None
+            if self.has_embedding is not None and node_id < len(self.has_embedding):
+                self.has_embedding[node_id] = False
+                self.has_embedding.flush()
+
+            # 关系在 flush 时统一过滤，连续删除多个实体只重写一次
+            self._removed_nodes.add(node_id)
+            self._dirty = True
+
+    def edge_count(self):
+        with self._lock:
+            self.flush()
+            return len(self.edge_src)
+
+    def stats(self):
+        with self._lock:
+            self.flush()
+            type_counts = np.bincount(np.asarray(self.edge_type), minlength=len(self.rel_types)) if len(self.edge_type) else []
+            return {
+                "entity_count": len(self.name_index),
+                "relationship_count": len(self.edge_src),
+                "triples_count": len(self.edge_src),
+                "relationship_types": {t: int(c) for t, c in zip(self.rel_types, type_counts) if c},
+                "labels": ["Entity"] if self.name_index else [],
+                "unindexed_node_count": len(self.nodes_without_embedding()),
+            }
+
+
+def normalize(vectors):
+    vectors = np.atleast_2d(vectors)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class EmbeddedGraphDatabase(GraphDatabase):
+    """使用 EmbeddedGraphStore 的图数据库，接口与 GraphDatabase 一致
+
+    导入、计算 embedding 的流程和结果格式化沿用 GraphDatabase，只替换读写图数据的部分。
+    """
+
+    store = None
+
+    def start(self):
+        if not config.enable_knowledge_graph or not config.enable_knowledge_base:
+            return
+
+        self.store = EmbeddedGraphStore(os.path.join(self.work_dir, "embedded"))
+        # 删除实体后未被查询触发的 flush 在退出时写入
+        atexit.register(self.store.flush)
+        self.status = "open"
+        self.save_graph_info(self.kgdb_name)
+
+    def close(self):
+        if self.store is not None:
+            self.store.flush()
+        self.status = "closed"
+
+    def ensure_schema(self):
+        pass
+
+    def refresh_schema_cache(self):
+        pass
+
+    def vector_index_exists(self):
+        return self.store.embeddings is not None
+
+    def ensure_vector_index(self):
+        pass
+
+    def import_triples(self, triples, kgdb_name='neo4j', batch_size=None, progress=None, typed_relation=False, total=None):
+        self.use_database(kgdb_name)
+        batch_size = int(batch_size or config.graph_import_batch_size)
+        total = total if total is not None else (len(triples) if hasattr(triples, "__len__") else None)
+
+        done, iterator = 0, iter(triples)
+        while batch := [row for _, row in zip(range(batch_size), iterator)]:
+            if typed_relation:
+                batch = [{**row, "r": row["r"].replace(" ", "_")} for row in batch]
+            self.store.add_triples(batch)
+            done += len(batch)
+            logger.info(f"Imported {done}{f'/{total}' if total else ''} triples to embedded graph")
+            if progress:
+                progress(done, total)
+
+        # 所有批次写入后一次性保存并重建 CSR
+        self.store.flush()
+        self.invalidate_stats()
+        return done
+
+    def _filter_without_embedding(self, entity_names):
+        return self.store.nodes_without_embedding(entity_names)
+
+    def _write_embeddings(self, rows):
+        self.store.set_embeddings(rows)
+
+    def query_nodes_without_embedding(self, kgdb_name='neo4j'):
+        self.use_database(kgdb_name)
+        return self.store.nodes_without_embedding()
+
+    def _load_entity_names(self):
+        return [name for name in self.store.names if name is not None]
+
+    def query_nodes(self, entity_names, threshold=0.78, kgdb_name='neo4j', hops=2, max_entities=5, limit=100,
+                    rel_types=None, max_fanout=None, **kwargs):
+        if not self.is_running():
+            raise Exception("图数据库未启动")
+
+        entity_names = list(dict.fromkeys(name for name in entity_names if name))
+        if not entity_names:
+            return []
+        if not self.vector_index_exists():
+            logger.error("向量索引不存在，请先创建索引")
+            return []
+
+        seeds = self.store.search(self.get_embedding(entity_names), top_k=max_entities, threshold=threshold)
+        results = self._expand_triples(seeds, hops, limit * len(entity_names), rel_types=rel_types, max_fanout=max_fanout)
+        logger.debug(f"Graph Query Entities: {entity_names}, {len(results)} relationships")
+        return results
+
+    def query_specific_entity(self, entity_name, kgdb_name='neo4j', hops=2, limit=100, rel_types=None, max_fanout=None):
+        if not entity_name:
+            logger.warning("实体名称为空")
+            return []
+
+        self.use_database(kgdb_name)
+        node_id = self.store.name_index.get(entity_name)
+        if node_id is None:
+            logger.info(f"未找到实体 {entity_name} 的相关信息")
+            return []
+
+        return self._expand_triples([node_id], hops, limit, rel_types=rel_types, max_fanout=max_fanout)
+
+    def query_node_info(self, node_name, kgdb_name='neo4j', hops=2, limit=100):
+        self.use_database(kgdb_name)
+        node_id = self.store.name_index.get(node_name)
+        return [] if node_id is None else self._expand_triples([node_id], hops, limit, directed=True)
+
+    def query_entity_like(self, keyword, kgdb_name='neo4j', hops=2, limit=100, max_seeds=10):
+        self.use_database(kgdb_name)
+        return self._expand_triples(self.store.find_nodes(keyword, max_seeds), hops, limit, directed=True)
+
+    def query_by_relationship_type(self, relationship_type, kgdb_name='neo4j', hops=2, limit=100):
+        self.use_database(kgdb_name)
+        seeds = self.store.nodes_with_rel_type(relationship_type)
+        return self._expand_triples(seeds, hops, limit, rel_types=[relationship_type], directed=True)
+
+    def query_all_nodes_and_relationships(self, kgdb_name='neo4j', hops=2):
+        raise NotImplementedError("嵌入式图存储不支持枚举全部路径，请使用 get_sample_nodes 或按实体查询")
+
+    def _expand_triples(self, seeds, hops, limit, rel_types=None, max_fanout=None, directed=False):
+        """从 seeds 展开并转换为与 GraphDatabase 查询结果一致的 [start_node, [relationship], end_node]"""
+        edges = self.store.expand(seeds, hops=hops, max_fanout=max_fanout or config.graph_max_fanout,
+                                  rel_types=rel_types, limit=limit, directed=directed)
+        return [[start, [relationship], end] for start, relationship, end in self.store.triples(edges)]
+
+    def get_sample_nodes(self, kgdb_name='neo4j', num=50):
+        self.use_database(kgdb_name)
+        return self.store.triples(range(min(int(num), self.store.edge_count())))
+
+    def delete_entity(self, entity_name=None, kgdb_name="neo4j"):
+        self.use_database(kgdb_name)
+        self.store.delete(entity_name)
+        self.invalidate_stats()
+
+    def get_graph_info(self, graph_name="neo4j"):
+        self.use_database(graph_name)
+        if self.status != "open" or not self.is_running():
+            return None
+
+        cached = self._stats_cache
+        if cached is None:
+            from datetime import datetime
+            stats = {"graph_name": graph_name, **self.store.stats(), "last_updated": datetime.now().isoformat()}
+            cached = self._stats_cache = (time.monotonic(), stats)
+        return {**cached[1], "status": self.status, "embed_model_name": self.embed_model_name}
+
+
+def benchmark_expand(num_nodes=100000, num_edges=500000, num_queries=1000, hops=2, max_fanout=50):
+    """在随机图上测试 k 跳展开的耗时（微秒/次）"""
+    import tempfile
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as path:
+        store = EmbeddedGraphStore(path)
+        store.add_triples({"h": f"e{h}", "r": "rel", "t": f"e{t}"}
+                          for h, t in rng.integers(0, num_nodes, size=(num_edges, 2)).tolist())
+        seeds = rng.integers(0, num_nodes, size=num_queries).tolist()
+
+        start = time.perf_counter()
+        for seed in seeds:
+            store.expand([seed], hops=hops, max_fanout=max_fanout)
+        elapsed = (time.perf_counter() - start) / num_queries * 1e6
+
+    logger.info(f"Embedded graph {hops}-hop expansion: {elapsed:.1f} us/query")
+    return elapsed
+
+
+if __name__ == "__main__":
+    print(f"{benchmark_expand():.1f} us/query")
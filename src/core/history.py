@@ -1,4 +1,50 @@
-from src.utils.prompts import get_system_prompt
+import re
+import asyncio
+
+from src import config
+from src.utils import logger
+from src.utils.prompts import get_system_prompt, history_summary_prompt_template
+from sqlalchemy.sql import func
+
+from server.db_manager import db_manager
+from server.models.thread_model import Thread, ThreadMessage
+
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+
+# 每条消息的角色、分隔符等额外开销
+MESSAGE_TOKEN_OVERHEAD = 4
+
+
+def count_tokens(text):
+    """估算文本的 token 数：中文字符约 1 个 token，其余字符约 4 个字符 1 个 token"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def count_message_tokens(message):
+    return count_tokens(message["content"]) + MESSAGE_TOKEN_OVERHEAD
+
+
+def split_by_tokens(dialog, max_tokens):
+    """从最新的消息开始保留，直到超过 max_tokens
+
+    Returns:
+        (evicted, kept): 被移出窗口的消息和保留的消息；保留部分不以 assistant 消息开头
+    """
+    start, used = len(dialog), 0
+    for i in range(len(dialog) - 1, -1, -1):
+        used += dialog[i].get("token_count") or count_message_tokens(dialog[i])
+        if used > max_tokens:
+            break
+        start = i
+
+    while start < len(dialog) and dialog[start]["role"] == "assistant":
+        start += 1
+
+    return dialog[:start], dialog[start:]
+
 
 class HistoryManager:
     def __init__(self, history=None, system_prompt=None):
@@ -31,15 +77,23 @@ class HistoryManager:
             self.add_ai(content)
             return self.messages
 
-    def get_history_with_msg(self, msg, role="user", max_rounds=None):
-        """Get history with new message, but not append it to history."""
-        if max_rounds is None:
-            history = self.messages[:]
-        else:
-            history = self.messages[-(2*max_rounds):]
+    def get_history_with_msg(self, msg, role="user", max_rounds=None, max_tokens=None):
+        """Get history with new message, but not append it to history.
+
+        系统消息始终保留；max_rounds 限制对话轮数，max_tokens 限制（含新消息在内的）总 token 数。
+        """
+        system = [m for m in self.messages if m["role"] == "system"]
+        dialog = [m for m in self.messages if m["role"] != "system"]
 
-        history.append({"role": role, "content": msg})
-        return history
+        if max_rounds is not None:
+            dialog = dialog[-(2*max_rounds):]
+
+        message = {"role": role, "content": msg}
+        if max_tokens:
+            budget = max_tokens - sum(count_message_tokens(m) for m in system + [message])
+            _, dialog = split_by_tokens(dialog, budget)
+
+        return system + [{"role": m["role"], "content": m["content"]} for m in dialog] + [message]
 
     def __str__(self):
         """会自动调用，print打印HistoryManager的对象时"""
@@ -49,3 +103,85 @@ class HistoryManager:
             lines.append(f"{message['role']}: {msg}")
         return "\n".join(lines)
 
+
+class ThreadHistory(HistoryManager):
+    """服务端保存的对话历史，以 thread_id 为键存储在 thread_message 表中
+
+    - 每条消息记录 token 数
+    - 超出 history_max_tokens 的早期对话会被总结为摘要，摘要作为系统消息放在历史的开头
+    """
+
+    def __init__(self, thread_id, user_id, system_prompt=None):
+        self.thread_id = thread_id
+        self.user_id = str(user_id)
+        super().__init__(system_prompt=system_prompt)
+        self.load()
+
+    def load(self):
+        """加载未被压缩的消息和最新的摘要，线程不存在时创建"""
+        with db_manager.get_session_context() as session:
+            thread = session.query(Thread).filter(Thread.id == self.thread_id).first()
+            if thread is None:
+                session.add(Thread(id=self.thread_id, user_id=self.user_id, agent_id="chat", title="新对话"))
+                return
+            if thread.user_id != self.user_id:
+                raise PermissionError(f"Thread {self.thread_id} does not belong to user {self.user_id}")
+
+            rows = session.query(ThreadMessage).filter(
+                ThreadMessage.thread_id == self.thread_id,
+                ThreadMessage.evicted == 0,
+            ).order_by(ThreadMessage.id).all()
+
+            for row in rows:
+                if row.role == "summary":
+                    self.add_system(f"以下是之前对话的摘要：\n{row.content}")
+                else:
+                    self.messages.append({"role": row.role, "content": row.content, "token_count": row.token_count})
+
+    def save_turn(self, query, response):
+        """保存一轮对话，返回本轮 user / assistant 的 token 数"""
+        usage = {"user": count_tokens(query) + MESSAGE_TOKEN_OVERHEAD,
+                 "assistant": count_tokens(response) + MESSAGE_TOKEN_OVERHEAD}
+        with db_manager.get_session_context() as session:
+            session.add(ThreadMessage(thread_id=self.thread_id, role="user", content=query, token_count=usage["user"]))
+            session.add(ThreadMessage(thread_id=self.thread_id, role="assistant", content=response,
+                                      token_count=usage["assistant"]))
+            session.query(Thread).filter(Thread.id == self.thread_id).update({Thread.update_at: func.now()})
+        return usage
+
+    async def asummarize(self, model, max_tokens=None):
+        """将超出窗口的早期对话与已有摘要合并为新的摘要"""
+        max_tokens = max_tokens or config.history_max_tokens
+        rows = await asyncio.to_thread(self._load_rows)
+        summary = next((row for row in reversed(rows) if row["role"] == "summary"), None)
+        dialog = [row for row in rows if row["role"] != "summary"]
+
+        budget = max_tokens - (summary["token_count"] if summary else 0)
+        evicted, _ = split_by_tokens(dialog, budget)
+        if not evicted:
+            return None
+
+        dialog_str = "\n".join(f"{row['role']}: {row['content']}" for row in evicted)
+        prompt = history_summary_prompt_template.format(summary=summary["content"] if summary else "", dialog=dialog_str)
+        response = await model.apredict(prompt)
+
+        evicted_ids = [row["id"] for row in evicted] + ([summary["id"]] if summary else [])
+        await asyncio.to_thread(self._save_summary, response.content, evicted_ids)
+        logger.info(f"Thread {self.thread_id}: summarized {len(evicted)} messages")
+        return response.content
+
+    def _load_rows(self):
+        with db_manager.get_session_context() as session:
+            rows = session.query(ThreadMessage).filter(
+                ThreadMessage.thread_id == self.thread_id,
+                ThreadMessage.evicted == 0,
+            ).order_by(ThreadMessage.id).all()
+            return [{"id": row.id, "role": row.role, "content": row.content, "token_count": row.token_count}
+                    for row in rows]
+
+    def _save_summary(self, content, evicted_ids):
+        with db_manager.get_session_context() as session:
+            session.query(ThreadMessage).filter(ThreadMessage.id.in_(evicted_ids)).update(
+                {ThreadMessage.evicted: 1}, synchronize_session=False)
+            session.add(ThreadMessage(thread_id=self.thread_id, role="summary", content=content,
+                                      token_count=count_tokens(content) + MESSAGE_TOKEN_OVERHEAD))
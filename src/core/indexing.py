@@ -60,15 +60,24 @@ def chunk_with_parser(file_path, params=None):
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap,
         separators=["\n\n", "\n", ".", " ", ""],
+        add_start_index=True,
     )
 
-    # 分割文档
-    nodes = text_splitter.split_documents(docs)
+    # 逐个文档分割，字符位置为块在所有文档依次拼接后的文本中的位置
+    nodes, offset = [], 0
+    for doc in docs:
+        for node in text_splitter.split_documents([doc]):
+            if node.metadata is None:
+                node.metadata = {}
+            start = node.metadata.pop("start_index", -1)
+            if start is not None and start >= 0:
+                node.metadata["start_char_idx"] = offset + start
+                node.metadata["end_char_idx"] = offset + start + len(node.page_content)
+            nodes.append(node)
+        offset += len(doc.page_content)
 
     # 添加序号信息到metadata
     for i, node in enumerate(nodes):
-        if node.metadata is None:
-            node.metadata = {}
         node.metadata["chunk_idx"] = i
 
     return nodes
@@ -85,14 +94,21 @@ def chunk_text(text, params=None):
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap,
-        separators=["\n\n", "\n", ".", " ", ""]
+        separators=["\n\n", "\n", ".", " ", ""],
+        add_start_index=True,
     )
 
-    # 分割文档
-    nodes = text_splitter.split_text(text)
+    # 分割文档，记录块在原文中的字符位置，用于合并相邻块时去掉重叠的部分
+    docs = text_splitter.create_documents([text])
 
     # 添加序号信息到metadata
-    nodes = [{"text": node, "metadata": {"chunk_idx": i}} for i, node in enumerate(nodes)]
+    nodes = []
+    for i, doc in enumerate(docs):
+        metadata = {"chunk_idx": i}
+        start = doc.metadata.get("start_index", -1)
+        if start >= 0:
+            metadata.update(start_char_idx=start, end_char_idx=start + len(doc.page_content))
+        nodes.append({"text": doc.page_content, "metadata": metadata})
     return nodes
 
 def chunk(text_or_path, params=None):
@@ -4,6 +4,7 @@ import requests
 import time
 import traceback
 import shutil
+from sqlalchemy import and_, or_, case, func
 from sqlalchemy.orm import joinedload
 from pathlib import Path
 import asyncio
@@ -12,14 +13,17 @@ from functools import lru_cache
 from diskcache import Cache
 from typing import List
 
-from pymilvus import MilvusClient, MilvusException
+from pymilvus import MilvusClient, MilvusException, DataType
 
 from src import config
 from src.utils import logger, hashstr
 from src.core.indexing import chunk_with_parser, chunk_text, parse_pdf_async
+from src.core import vector_precision as vp
+from src.core.context_packing import get_score, merge_overlap
+from src.core.entity_index import EntityMatcher, entity_weights, rank_by_entity_overlap
 from server.db_manager import db_manager
-from server.models.kb_models import KnowledgeDatabase, KnowledgeFile, KnowledgeNode
-from src.utils.db_migration import migrate_knowledge_db
+from server.models.kb_models import KnowledgeDatabase, KnowledgeFile, KnowledgeNode, KnowledgeNodeEntity
+from src.utils.db_migration import migrate_knowledge_db, migrate_node_chunk_idx
 
 # 一、初始化与配置相关方法
 # 1. __init__(): 初始化知识库，设置工作目录、缓存、默认参数，检查数据迁移，加载模型
@@ -41,6 +45,8 @@ from src.utils.db_migration import migrate_knowledge_db
 # 11. add_node(): 添加知识块节点
 # 12. get_nodes_by_file(): 获取文件下的所有知识块
 # 13. get_nodes_by_filter(): 根据条件筛选知识块
+# 14. index_node_entities(): 记录知识块中提及的图谱实体
+# 15. rebuild_entity_index(): 重建知识库的实体索引
 
 # 三、文件处理与索引方法
 # 1. save_files_for_pending_indexing(): 保存待索引文件并分块
@@ -57,6 +63,7 @@ from src.utils.db_migration import migrate_knowledge_db
 # 5. search_by_vector(): 通过向量执行搜索
 # 6. examples(): 获取知识库示例
 # 7. search_by_id(): 通过ID搜索
+# 8. expand_by_entities(): 将图谱实体展开为提及它们的知识块，按实体重合程度调整排序
 
 # 五、Milvus向量数据库操作方法
 # 1. connect_to_milvus(): 连接Milvus数据库
@@ -76,6 +83,10 @@ from src.utils.db_migration import migrate_knowledge_db
 # 1. parse_node_data(): 解析节点数据
 # 2. gen_filename_from_url(): 从URL生成文件名
 
+# chunk_idx 等为动态字段，用于合并同一文件中相邻的块
+SEARCH_OUTPUT_FIELDS = ["text", "file_id", "chunk_idx", "start_char_idx", "end_char_idx"]
+
+
 class KnowledgeBase:
 
     def __init__(self) -> None:
@@ -84,8 +95,8 @@ class KnowledgeBase:
         self.cache_dir = os.path.join(self.work_dir, ".cache")
         os.makedirs(self.cache_dir, exist_ok=True)
 
-        # 初始化磁盘缓存
-        self.disk_cache = Cache(self.cache_dir)
+        # 初始化磁盘缓存，检索结果以 db_id 为 tag，知识库内容变更时按 tag 失效
+        self.disk_cache = Cache(self.cache_dir, tag_index=True)
 
         # 配置缓存过期时间（秒）
         self.cache_ttl = 300  # 5分钟
@@ -95,6 +106,12 @@ class KnowledgeBase:
         self.default_rerank_threshold = 0.1
         self.default_max_query_count = 20
 
+        # 知识库的向量存储精度在创建后不会改变，缓存起来避免每次检索都查询 SQLite
+        self._precision_cache = {}
+
+        # 图谱实体名的词典匹配器，(实体名列表, EntityMatcher)，图谱写入后实体名列表会重新生成
+        self._entity_matcher = (None, None)
+
         # 检查是否需要从JSON文件迁移到SQLite
         self._check_migration()
 
@@ -214,6 +231,9 @@ class KnowledgeBase:
             except Exception as e:
                 logger.error(f"迁移过程中出错: {e}")
 
+        # 检查 knowledge_nodes 是否有 chunk_idx 列
+        migrate_node_chunk_idx()
+
     def _load_models(self):
         """所有需要重启的模型"""
         if not config.enable_knowledge_base:
@@ -267,6 +287,7 @@ class KnowledgeBase:
             if db:
                 # Manually delete associated files and nodes if cascade is not set up or to be sure
                 files = session.query(KnowledgeFile).filter_by(database_id=db_id).all()
+                session.query(KnowledgeNodeEntity).filter_by(database_id=db_id).delete()
                 for file_obj in files:
                     session.query(KnowledgeNode).filter_by(file_id=file_obj.file_id).delete()
                     session.delete(file_obj)
@@ -314,6 +335,7 @@ class KnowledgeBase:
         """从数据库中删除文件记录及其关联的节点"""
         with db_manager.get_session_context() as session:
             # First, delete associated nodes
+            session.query(KnowledgeNodeEntity).filter_by(file_id=file_id).delete()
             session.query(KnowledgeNode).filter_by(file_id=file_id).delete()
             # Then, delete the file
             file_obj = session.query(KnowledgeFile).filter_by(file_id=file_id).first()
@@ -347,6 +369,7 @@ class KnowledgeBase:
                 hash=hash_value or hashstr(text, with_salt=True), # Ensure hash is present
                 start_char_idx=start_char_idx,
                 end_char_idx=end_char_idx,
+                chunk_idx=(metadata or {}).get("chunk_idx"),
                 meta_info=metadata or {}
             )
             session.add(node)
@@ -359,6 +382,25 @@ class KnowledgeBase:
             nodes = session.query(KnowledgeNode).filter_by(file_id=file_id).all()
             return [node.to_dict() for node in nodes]
 
+    def get_nodes_by_chunk_positions(self, positions):
+        """按 (file_id, chunk_idx) 批量获取知识块，一次查询
+
+        Args:
+            positions: {file_id: [chunk_idx, ...]}
+        """
+        if not positions:
+            return []
+        conditions = [and_(KnowledgeNode.file_id == file_id, KnowledgeNode.chunk_idx.in_(list(idxs)))
+                      for file_id, idxs in positions.items() if idxs]
+        with db_manager.get_session_context() as session:
+            nodes = session.query(KnowledgeNode).filter(or_(*conditions)).all()
+            return [node.to_dict() for node in nodes]
+
+    def get_nodes_by_ids(self, node_ids):
+        with db_manager.get_session_context() as session:
+            nodes = session.query(KnowledgeNode).filter(KnowledgeNode.id.in_(list(node_ids))).all()
+            return [node.to_dict() for node in nodes]
+
     def get_nodes_by_filter(self, file_id=None, search_text=None, limit=100):
         """根据条件筛选知识块"""
         with db_manager.get_session_context() as session:
@@ -370,21 +412,139 @@ class KnowledgeBase:
             nodes = query.limit(limit).all()
             return [node.to_dict() for node in nodes]
 
-    def create_database(self, database_name, description, dimension=None):
-        """创建一个数据库（业务逻辑）"""
+    def get_entity_matcher(self):
+        """图谱实体名的词典匹配器，知识图谱未启用或图数据库未启动时返回 None"""
+        if not config.enable_knowledge_graph:
+            return None
+
+        from src import graph_base
+        if not graph_base.is_running():
+            return None
+
+        names = graph_base.get_entity_names()
+        cached_names, matcher = self._entity_matcher
+        if names is not cached_names:
+            matcher = EntityMatcher(names)
+            self._entity_matcher = (names, matcher)
+        return matcher
+
+    def index_node_entities(self, db_id, nodes, matcher=None):
+        """记录知识块中提及的图谱实体，已有的记录会被替换
+
+        Args:
+            nodes: 知识块 {"id", "file_id", "text"} 列表
+
+        Returns:
+            int: 写入的 (知识块, 实体) 记录数量
+        """
+        matcher = matcher or self.get_entity_matcher()
+        if not matcher or not nodes:
+            return 0
+
+        rows = [{"database_id": db_id, "file_id": node["file_id"], "node_id": node["id"], "entity": entity}
+                for node in nodes for entity in matcher.match(node["text"])]
+        with db_manager.get_session_context() as session:
+            session.query(KnowledgeNodeEntity).filter(
+                KnowledgeNodeEntity.node_id.in_([node["id"] for node in nodes])).delete(synchronize_session=False)
+            session.bulk_insert_mappings(KnowledgeNodeEntity, rows)
+        return len(rows)
+
+    def rebuild_entity_index(self, db_id):
+        """按当前图谱中的实体重建知识库的实体索引，图谱导入新的实体后调用
+
+        Returns:
+            int: 写入的 (知识块, 实体) 记录数量
+        """
+        matcher = self.get_entity_matcher()
+        if matcher is None:
+            raise ValueError("知识图谱未启用或图数据库未启动")
+
+        with db_manager.get_session_context() as session:
+            session.query(KnowledgeNodeEntity).filter_by(database_id=db_id).delete()
+            file_ids = [f.file_id for f in session.query(KnowledgeFile.file_id).filter_by(database_id=db_id)]
+
+        count = sum(self.index_node_entities(db_id, self.get_nodes_by_file(file_id), matcher) for file_id in file_ids)
+        logger.info(f"知识库 {db_id} 的实体索引重建完成，共 {count} 条记录，{len(matcher)} 个实体")
+        return count
+
+    def get_entities_by_nodes(self, node_ids):
+        """{知识块 id: 提及的实体集合}"""
+        result = {}
+        if not node_ids:
+            return result
+        with db_manager.get_session_context() as session:
+            rows = session.query(KnowledgeNodeEntity.node_id, KnowledgeNodeEntity.entity).filter(
+                KnowledgeNodeEntity.node_id.in_(list(node_ids))).all()
+        for node_id, entity in rows:
+            result.setdefault(node_id, set()).add(entity)
+        return result
+
+    def get_nodes_by_entities(self, db_id, weights, limit=100, exclude=()):
+        """通过倒排索引查找提及这些实体的知识块
+
+        在 SQL 中按知识块聚合，按提及实体的权重之和从高到低取前 limit 个，高频实体不会挤掉重合程度高的知识块。
+
+        Args:
+            weights: {实体名: 权重}
+            exclude: 不需要返回的知识块 id（如已被向量检索命中的）
+
+        Returns:
+            dict: {知识块 id: 提及的实体集合}，按权重之和从高到低排列
+        """
+        if not weights:
+            return {}
+
+        entities = list(weights)
+        score = func.sum(case(weights, value=KnowledgeNodeEntity.entity, else_=0.0))
+        with db_manager.get_session_context() as session:
+            query = session.query(KnowledgeNodeEntity.node_id).filter(
+                KnowledgeNodeEntity.database_id == db_id, KnowledgeNodeEntity.entity.in_(entities))
+            if exclude:
+                query = query.filter(KnowledgeNodeEntity.node_id.notin_(list(exclude)))
+            node_ids = [row.node_id for row in query.group_by(KnowledgeNodeEntity.node_id)
+                        .order_by(score.desc(), KnowledgeNodeEntity.node_id).limit(limit)]
+            if not node_ids:
+                return {}
+            rows = session.query(KnowledgeNodeEntity.node_id, KnowledgeNodeEntity.entity).filter(
+                KnowledgeNodeEntity.node_id.in_(node_ids), KnowledgeNodeEntity.entity.in_(entities)).all()
+
+        result = {node_id: set() for node_id in node_ids}
+        for node_id, entity in rows:
+            result[node_id].add(entity)
+        return result
+
+    def create_database(self, database_name, description, dimension=None, vector_precision=None):
+        """创建一个数据库（业务逻辑）
+
+        Args:
+            vector_precision: 向量存储精度，可选 float32 / float16 / binary，默认 float32
+        """
         dimension = dimension or self.embed_model.get_dimension()
+        vector_precision = vp.check_precision(vector_precision)
+        if vector_precision == "binary" and dimension % 8 != 0:
+            raise ValueError(f"binary 存储要求向量维度是 8 的倍数，当前维度: {dimension}")
+
         db_id = f"kb_{hashstr(database_name, with_salt=True)}"
         db_dict = self.create_database_record(
             db_id=db_id,
             name=database_name,
             description=description,
             embed_model=self.embed_model.embed_model_fullname,
-            dimension=dimension
+            dimension=dimension,
+            metadata={"vector_precision": vector_precision}
         )
         self._ensure_db_folders(db_id)
-        self.add_collection(db_id, dimension)
+        self.add_collection(db_id, dimension, vector_precision=vector_precision)
         return db_dict
 
+    def get_vector_precision(self, db_id):
+        """获取知识库的向量存储精度，旧的知识库没有记录时为 float32"""
+        if db_id not in self._precision_cache:
+            db = self.get_database_by_id(db_id) or {}
+            precision = (db.get("metadata") or {}).get("vector_precision")
+            self._precision_cache[db_id] = vp.check_precision(precision)
+        return self._precision_cache[db_id]
+
     def _ensure_db_folders(self, db_id):
         db_folder = os.path.join(self.work_dir, db_id)
         uploads_folder = os.path.join(db_folder, "uploads")
@@ -592,7 +752,9 @@ class KnowledgeBase:
             docs_text = [node["text"] for node in nodes_to_index]
 
             logger.info(f"正在为文件 {file_id} 的 {len(docs_text)} 个块生成向量...")
+            # vectors 为 (n, dim) 的 np.ndarray，下面的 vectors[i] 是行视图，不会复制数据
             vectors = await self.embed_model.abatch_encode(docs_text)
+            vectors = vp.convert_vectors(vectors, self.get_vector_precision(db_id))
             logger.info(f"文件 {file_id} 的向量生成完毕。")
 
             data_to_insert = []
@@ -611,14 +773,24 @@ class KnowledgeBase:
                     milvus_entry["start_char_idx"] = node["start_char_idx"]
                 if "end_char_idx" in node and node["end_char_idx"] is not None:
                     milvus_entry["end_char_idx"] = node["end_char_idx"]
+                if node.get("chunk_idx") is not None:
+                    milvus_entry["chunk_idx"] = node["chunk_idx"]
 
                 data_to_insert.append(milvus_entry)
 
             if data_to_insert:
                 logger.info(f"正在将文件 {file_id} 的 {len(data_to_insert)} 个向量插入 Milvus 集合 {db_id}...")
                 self.client.insert(collection_name=db_id, data=data_to_insert)
+                self.invalidate_query_cache(db_id)
                 logger.info(f"文件 {file_id} 的向量成功插入 Milvus。")
 
+            try:
+                count = self.index_node_entities(db_id, nodes_to_index)
+                logger.info(f"文件 {file_id} 的实体索引写入 {count} 条记录")
+            except Exception as e:
+                # 实体索引只用于图谱展开检索，失败不影响文件的向量索引
+                logger.warning(f"文件 {file_id} 的实体索引失败: {e}")
+
             self.update_file_status(file_id, "done")
             logger.info(f"文件 {file_id} 索引成功完成。")
             return {"status": "success", "message": "文件索引成功"}
@@ -635,6 +807,7 @@ class KnowledgeBase:
             # From Milvus
             logger.info(f"Deleting vectors for file_id {file_id} from Milvus collection {db_id}")
             self.client.delete(collection_name=db_id, filter=f"file_id == '{file_id}'")
+            self.invalidate_query_cache(db_id)
             logger.info(f"Milvus deletion successful for file_id {file_id}.")
         except Exception as e:
             logger.error(f"Error deleting file {file_id} from Milvus collection {db_id}: {e}")
@@ -660,6 +833,8 @@ class KnowledgeBase:
             logger.error(f"Error dropping Milvus collection {db_id}: {e}")
             # Decide if to proceed with DB deletion. For now, we proceed.
 
+        self._precision_cache.pop(db_id, None)
+        self.invalidate_query_cache(db_id)
         if self.delete_database_record(db_id): # This now also handles deleting files/nodes
             logger.info(f"Successfully deleted database record {db_id} and associated data from SQLite.")
         else:
@@ -681,7 +856,39 @@ class KnowledgeBase:
     #* Below is the code for retriever #
     ###################################
 
-    def query(self, query_text, db_id, **kwargs): # Renamed 'query' to 'query_text' to avoid clash
+    def query(self, query_text, db_id, **kwargs):
+        """检索知识库，结果在 cache_ttl 内缓存；知识库的文件变更时失效
+
+        重排序超时或失败时的结果保持向量检索的顺序，不缓存，之后相同的查询会重新尝试重排序。
+        """
+        cache_key = self._query_cache_key(query_text, db_id, kwargs)
+        result = self.disk_cache.get(cache_key)
+        if result is None:
+            result = self._query(query_text, db_id, **kwargs)
+            if not result.get("rerank_skipped"):
+                self.disk_cache.set(cache_key, result, expire=self.cache_ttl, tag=db_id)
+        return result
+
+    def _query_cache_key(self, query_text, db_id, kwargs):
+        params = {k: kwargs.get(k) for k in ("distance_threshold", "rerank_threshold", "max_query_count",
+                                              "top_k", "rerank_batch_size", "rerank_max_length", "neighbor_window")}
+        reranker = config.reranker if config.enable_reranker else None
+        key = json.dumps([db_id, query_text, config.embed_model, reranker, params], ensure_ascii=False, sort_keys=True)
+        return f"query:{hashstr(key)}"
+
+    def invalidate_query_cache(self, db_id):
+        self.disk_cache.evict(db_id)
+
+    def embed_query(self, query_text):
+        """计算查询向量，结果在 cache_ttl 内缓存"""
+        cache_key = f"embed:{hashstr(config.embed_model + ':' + query_text)}"
+        vector = self.disk_cache.get(cache_key)
+        if vector is None:
+            vector = self.embed_model.batch_encode([query_text])[0]
+            self.disk_cache.set(cache_key, vector, expire=self.cache_ttl)
+        return vector
+
+    def _query(self, query_text, db_id, **kwargs): # Renamed 'query' to 'query_text' to avoid clash
         distance_threshold = kwargs.get("distance_threshold", self.default_distance_threshold)
         rerank_threshold = kwargs.get("rerank_threshold", self.default_rerank_threshold)
         max_query_count = kwargs.get("max_query_count", self.default_max_query_count)
@@ -726,24 +933,138 @@ class KnowledgeBase:
         # 过滤阈值 distance_threshold
         db_result_filtered = [r for r in all_db_result_dicts if r["distance"] > distance_threshold]
 
+        rerank_skipped = False
         if config.enable_reranker and len(db_result_filtered) > 0 and self.reranker:
             texts_for_rerank = [r["entity"]["text"] for r in db_result_filtered if r.get("entity") and r["entity"].get("text")]
             if texts_for_rerank: # Ensure there are texts to rerank
-                rerank_scores = self.reranker.compute_score([query_text, texts_for_rerank], normalize=False) # Use query_text
-                for i, r_filtered in enumerate(db_result_filtered):
-                    if i < len(rerank_scores): # Check bounds
-                         r_filtered["rerank_score"] = rerank_scores[i]
-                db_result_filtered.sort(key=lambda x: x.get("rerank_score", -1), reverse=True) # Handle missing rerank_score
-                db_result_filtered = [_res for _res in db_result_filtered if _res.get("rerank_score", -1) > rerank_threshold]
+                rerank_scores = self.reranker.compute_score([query_text, texts_for_rerank],
+                                                            batch_size=kwargs.get("rerank_batch_size"),
+                                                            max_length=kwargs.get("rerank_max_length"),
+                                                            normalize=False) # Use query_text
+                if rerank_scores is None:
+                    # 重排序超时或失败，保持向量检索的顺序
+                    rerank_skipped = True
+                    logger.warning(f"Rerank skipped for query `{query_text}`, keep vector order")
+                else:
+                    for i, r_filtered in enumerate(db_result_filtered):
+                        if i < len(rerank_scores): # Check bounds
+                             r_filtered["rerank_score"] = rerank_scores[i]
+                    db_result_filtered.sort(key=lambda x: x.get("rerank_score", -1), reverse=True) # Handle missing rerank_score
+                    db_result_filtered = [_res for _res in db_result_filtered if _res.get("rerank_score", -1) > rerank_threshold]
 
         if kwargs.get("top_k", None):
             db_result_filtered = db_result_filtered[:kwargs["top_k"]]
 
+        if kwargs.get("neighbor_window"):
+            db_result_filtered = self.expand_neighbors(db_result_filtered, int(kwargs["neighbor_window"]))
+
         return {
             "results": db_result_filtered, # 已过滤且经过重排序
             "all_results": all_db_result_dicts, # Return the full list before filtering for analysis
+            "rerank_skipped": rerank_skipped,
         }
 
+    def expand_neighbors(self, results, window):
+        """将每个命中的块扩展为前后各 window 个相邻块拼接成的段落
+
+        相邻块通过 (file_id, chunk_idx) 索引一次批量查询；同一文件中窗口重叠或相邻的命中合并为一个段落，
+        段落使用其中分数最高的命中的 id 和分数，entity 中的 window 为段落覆盖的 chunk_idx 范围。
+        """
+        if not window or not results:
+            return results
+
+        # 较早索引的数据在 Milvus 中没有 chunk_idx，通过节点 id（即 Milvus 主键）补齐
+        missing = [r["id"] for r in results if r["entity"].get("chunk_idx") is None]
+        if missing:
+            positions = {n["id"]: (n["file_id"], n["chunk_idx"]) for n in self.get_nodes_by_ids(missing)}
+            for r in results:
+                if r["id"] in positions:
+                    r["entity"]["file_id"], r["entity"]["chunk_idx"] = positions[r["id"]]
+
+        by_file, expanded = {}, []
+        for r in results:
+            if r["entity"].get("file_id") and r["entity"].get("chunk_idx") is not None:
+                by_file.setdefault(r["entity"]["file_id"], []).append(r)
+            else:
+                expanded.append(r)
+
+        wanted = {}
+        for file_id, hits in by_file.items():
+            for r in hits:
+                idx = r["entity"]["chunk_idx"]
+                wanted.setdefault(file_id, set()).update(range(max(idx - window, 0), idx + window + 1))
+        chunks = {(n["file_id"], n["chunk_idx"]): n for n in self.get_nodes_by_chunk_positions(wanted)}
+
+        for file_id, hits in by_file.items():
+            hits.sort(key=lambda r: r["entity"]["chunk_idx"])
+            groups = []
+            for r in hits:
+                idx = r["entity"]["chunk_idx"]
+                lo, hi = max(idx - window, 0), idx + window
+                if groups and lo <= groups[-1]["hi"] + 1:
+                    groups[-1]["hi"] = max(groups[-1]["hi"], hi)
+                    groups[-1]["hits"].append(r)
+                else:
+                    groups.append({"lo": lo, "hi": hi, "hits": [r]})
+
+            for group in groups:
+                best = max(group["hits"], key=get_score)
+                text, start, end = "", None, None
+                for idx in range(group["lo"], group["hi"] + 1):
+                    chunk = chunks.get((file_id, idx))
+                    if not chunk or not chunk["text"]:
+                        continue
+                    if text:
+                        # 按字符位置去掉 chunk_overlap 造成的重复文本，缺少位置时直接拼接
+                        text = merge_overlap(text, chunk["text"], end, chunk["start_char_idx"])
+                    else:
+                        text, start = chunk["text"], chunk["start_char_idx"]
+                    end = chunk["end_char_idx"]
+                entity = {**best["entity"], "text": text or best["entity"]["text"], "window": [group["lo"], group["hi"]]}
+                if text:
+                    # 段落的字符位置，之后 merge_adjacent 合并相邻段落时使用
+                    entity.update(start_char_idx=start, end_char_idx=end)
+                expanded.append({**best, "entity": entity, "hit_ids": [r["id"] for r in group["hits"]]})
+
+        expanded.sort(key=get_score, reverse=True)
+        return expanded
+
+    def expand_by_entities(self, db_id, results, query_entities, graph_entities, top_k=5, boost=0.2, neighbor_weight=0.5):
+        """将图谱检索命中的实体展开为提及它们的知识块，并按实体重合程度调整检索结果的排序
+
+        Args:
+            results: query() 返回的 results
+            query_entities: 问题中的实体，权重为 1
+            graph_entities: 图谱检索结果中的实体，其余实体的权重为 neighbor_weight
+            top_k: 最多加入的未被向量检索命中的知识块数量
+
+        Returns:
+            list[dict]: 调整后的结果，展开得到的知识块带有 "source": "graph"
+        """
+        matcher = self.get_entity_matcher()
+        if matcher is not None:
+            # 问题中提到的实体名可能与图谱中的不完全一致，用词典匹配补充
+            query_entities = set(query_entities)
+            for entity in list(query_entities):
+                query_entities |= matcher.match(entity)
+        weights = entity_weights(query_entities, graph_entities, neighbor_weight=neighbor_weight)
+
+        hit_ids = {node_id for r in results for node_id in (r.get("hit_ids") or [r["id"]])}
+        node_entities = self.get_entities_by_nodes(hit_ids)
+        # 候选已在 SQL 中按重合程度排序，只为前 top_k 个读取文本
+        candidates = self.get_nodes_by_entities(db_id, weights, limit=top_k, exclude=hit_ids)
+        node_entities.update(candidates)
+        ranked_ids = list(candidates)
+        extra, files = {}, {}
+        for node in self.get_nodes_by_ids(ranked_ids):
+            if node["file_id"] not in files:
+                file_info = self.get_file_by_id(node["file_id"]) or {}
+                files[node["file_id"]] = {k: file_info.get(k) for k in ("file_id", "filename", "file_type")}
+            entity = {k: node[k] for k in ("text", "file_id", "chunk_idx", "start_char_idx", "end_char_idx")}
+            extra[node["id"]] = {"id": node["id"], "entity": entity, "file": files[node["file_id"]], "source": "graph"}
+
+        return rank_by_entity_overlap(results, node_entities, weights, boost=boost, extra=extra, max_extra=top_k)
+
     def get_retriever_by_db_id(self, db_id):
         retriever_params = {
             "distance_threshold": self.default_distance_threshold,
@@ -823,7 +1144,7 @@ class KnowledgeBase:
             logger.warning(f"获取集合 {collection_name} 信息失败: {e}")
             return {"name": collection_name, "row_count": 0, "status": "错误", "error_message": str(e)}
 
-    def add_collection(self, collection_name, dimension=None):
+    def add_collection(self, collection_name, dimension=None, vector_precision=None):
         if self.client.has_collection(collection_name=collection_name):
             logger.warning(f"Collection {collection_name} already exists. It will be used as is or needs manual deletion if schema change is required.")
             # Not dropping by default to avoid data loss.
@@ -831,6 +1152,21 @@ class KnowledgeBase:
             # self.client.create_collection(collection_name=collection_name, dimension=dimension)
             return
 
+        vector_precision = vp.check_precision(vector_precision)
+        if vector_precision != "float32":
+            # 非默认精度需要显式定义 schema，与快速创建的默认 schema 保持一致：id 主键 + vector + 动态字段
+            dimension = dimension or self.embed_model.get_dimension()
+            schema = MilvusClient.create_schema(auto_id=False, enable_dynamic_field=True)
+            schema.add_field(field_name="id", datatype=DataType.INT64, is_primary=True)
+            schema.add_field(field_name="vector", datatype=vp.get_field_type(vector_precision), dim=dimension)
+
+            index_params = self.client.prepare_index_params()
+            index_params.add_index(field_name="vector", **vp.get_index_params(vector_precision))
+
+            self.client.create_collection(collection_name=collection_name, schema=schema, index_params=index_params)
+            logger.info(f"Milvus collection {collection_name} created with dimension {dimension}, precision {vector_precision}.")
+            return
+
         self.client.create_collection(
             collection_name=collection_name,
             dimension=dimension or self.embed_model.get_dimension(),
@@ -847,20 +1183,35 @@ class KnowledgeBase:
 
 
     def search(self, query_text, collection_name, limit=3): # Renamed query to query_text
-        query_vectors = self.embed_model.batch_encode([query_text]) # Use query_text
-        return self.search_by_vector(query_vectors[0], collection_name, limit)
+        return self.search_by_vector(self.embed_query(query_text), collection_name, limit)
 
     def search_by_vector(self, vector, collection_name, limit=3):
         self.client.load_collection(collection_name)
+        precision = self.get_vector_precision(collection_name)
+        if precision == "binary":
+            return self._search_binary(vector, collection_name, limit)
+
         res = self.client.search(
             collection_name=collection_name,
-            data=[vector],
+            data=[vp.convert_vectors([vector], precision)[0]],
             limit=limit,
-            output_fields=["text", "file_id"],
+            output_fields=SEARCH_OUTPUT_FIELDS,
         )
         # res is a list of SearchResult lists. For a single query vector, it's res[0].
         return res[0] if res else []
 
+    def _search_binary(self, vector, collection_name, limit=3):
+        """二值向量先按汉明距离召回更多候选，再用全精度查询向量重新打分"""
+        res = self.client.search(
+            collection_name=collection_name,
+            data=vp.convert_vectors([vector], "binary"),
+            limit=limit * vp.BINARY_RESCORE_MULTIPLIER,
+            output_fields=[*SEARCH_OUTPUT_FIELDS, "vector"],
+            search_params={"metric_type": "HAMMING"},
+        )
+        candidates = res[0] if res else []
+        return vp.rescore_binary(vector, candidates, limit)
+
 
     def examples(self, collection_name, limit=20):
         res = self.client.query(
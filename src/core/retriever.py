@@ -1,15 +1,31 @@
+import re
+import json
+import time
+import asyncio
+import difflib
 import traceback
+from collections import OrderedDict
+from functools import partial
 
 from src import config, knowledge_base, graph_base
 from src.models.rerank_model import get_reranker
 from src.utils.logging_config import logger
 from src.models import select_model
 from src.core.operators import HyDEOperator
+from src.core.context_packing import pack_knowledge_base, select_by_budget
+
+# 预检索的结果在 PREFETCH_TTL 秒内有效，最终的问题与预检索时的草稿相似度不低于 PREFETCH_SIMILARITY 时复用
+PREFETCH_TTL = 60
+PREFETCH_SIMILARITY = 0.9
+PREFETCH_MAX_ENTRIES = 1024
+
 
 class Retriever:
 
     def __init__(self):
         self._load_models()
+        # 每个用户最近一次预检索的知识库结果 {key: {"query", "signature", "time", "task"}}
+        self._prefetched = OrderedDict()
 
     def _load_models(self):
 
@@ -25,9 +41,99 @@ class Retriever:
         refs["knowledge_base"] = self.query_knowledgebase(query, history, refs)
         refs["graph_base"] = self.query_graph(query, history, refs)
         refs["web_search"] = self.query_web(query, history, refs)
+        self.expand_graph_chunks(refs)
 
         return refs
 
+    async def aretrieval(self, query, history, meta, prefetch_key=None):
+        """异步检索：知识库、图数据库（含实体识别）、网络搜索并发执行
+
+        指定 prefetch_key 时，如果该用户预检索的草稿与最终的问题（开启查询改写时为改写后的问题）足够接近，
+        则直接复用预检索的知识库结果
+        """
+        refs = {"query": query, "history": history, "meta": meta}
+        refs["model_name"] = config.model_name
+
+        async def query_knowledgebase():
+            if prefetch_key is None or not meta.get("db_id") or not config.enable_knowledge_base:
+                return await self.aquery_knowledgebase(query, history, refs)
+
+            # 预检索使用未改写的草稿，所以先改写最终的问题，再与草稿比较
+            rw_query = await self.arewrite_query(query, history, refs)
+            prefetched = await self.atake_prefetched(prefetch_key, rw_query, meta)
+            if prefetched is not None:
+                logger.debug(f"Reuse prefetched knowledge base results for `{rw_query}`")
+                return {**prefetched, "rw_query": rw_query}
+            kb_refs = {**refs, "meta": {**meta, "mode": "search", "use_rewrite_query": "off"}}
+            return await self.aquery_knowledgebase(rw_query, history, kb_refs)
+
+        async def query_graph_with_entities():
+            refs["entities"] = await self.areco_entities(query, history, refs)
+            return await asyncio.to_thread(self.query_graph, query, history, refs)
+
+        refs["knowledge_base"], refs["graph_base"], refs["web_search"] = await asyncio.gather(
+            query_knowledgebase(),
+            query_graph_with_entities(),
+            asyncio.to_thread(self.query_web, query, history, refs),
+        )
+        await asyncio.to_thread(self.expand_graph_chunks, refs)
+        return refs
+
+    async def aprefetch(self, key, query, history, meta):
+        """用户输入过程中预先检索知识库，同时预热查询向量和检索结果的缓存
+
+        同一个 key 的新草稿会取消尚未完成的旧预检索。预检索不改写查询（每次输入停顿都调用 LLM 的代价太高），
+        开启查询改写时，只有最终的问题改写后仍与草稿足够接近才会复用预检索的结果。
+
+        Returns:
+            asyncio.Task | None: 预检索任务，预检索未启用或知识库未启用时返回 None
+        """
+        if not config.enable_prefetch or not meta.get("db_id") or not config.enable_knowledge_base:
+            return None
+
+        previous = self._prefetched.pop(key, None)
+        if previous and not previous["task"].done():
+            previous["task"].cancel()
+
+        refs = {"query": query, "history": history, "meta": {**meta, "mode": "search", "use_rewrite_query": "off"}}
+        task = asyncio.ensure_future(self.aquery_knowledgebase(query, history, refs))
+        self._prefetched[key] = {
+            "query": query,
+            "signature": self._prefetch_signature(meta),
+            "time": time.time(),
+            "task": task,
+        }
+        while len(self._prefetched) > PREFETCH_MAX_ENTRIES:
+            self._prefetched.popitem(last=False)
+        return task
+
+    async def atake_prefetched(self, key, query, meta):
+        """取出与最终问题匹配的预检索结果，未完成的预检索会等待其完成"""
+        entry = self._prefetched.pop(key, None)
+        if entry is None or time.time() - entry["time"] > PREFETCH_TTL:
+            return None
+        if entry["signature"] != self._prefetch_signature(meta):
+            return None
+
+        similarity = difflib.SequenceMatcher(None, _normalize_query(entry["query"]), _normalize_query(query)).ratio()
+        if similarity < PREFETCH_SIMILARITY:
+            if not entry["task"].done():
+                entry["task"].cancel()
+            return None
+
+        task = entry["task"]
+        await asyncio.wait({task})
+        if task.cancelled():
+            return None
+        if task.exception():
+            logger.warning(f"Prefetched retrieval failed: {task.exception()}")
+            return None
+        return task.result()
+
+    def _prefetch_signature(self, meta):
+        keys = ("db_id", "distanceThreshold", "rerankThreshold", "rerankBatchSize", "rerankMaxLength", "maxQueryCount", "topK", "neighborWindow")
+        return json.dumps([{k: meta.get(k) for k in keys}, config.use_rewrite_query], sort_keys=True)
+
     def restart(self):
         """所有需要重启的模型"""
         self._load_models()
@@ -38,26 +144,39 @@ class Retriever:
             return query
 
         external_parts = []
+        # 参考资料的 token 预算，按知识库、图数据库、网络搜索的顺序分配
+        budget = config.context_max_tokens or None
 
-        # 解析知识库的结果
+        # 解析知识库的结果：去重、合并相邻的块、按分数在预算内选择
         kb_res = refs.get("knowledge_base", {}).get("results", [])
         if kb_res:
-            kb_text = "\n".join(f"{r['id']}: {r['entity']['text']}" for r in kb_res)
-            external_parts.extend(["知识库信息:", kb_text])
+            passages, used = pack_knowledge_base(kb_res, query, max_tokens=budget,
+                                                 extract_sentences=config.context_extract_sentences)
+            budget = budget and budget - used
+            if passages:
+                kb_text = "\n".join(f"{p['id']}: {p['text']}" for p in passages)
+                external_parts.extend(["知识库信息:", kb_text])
 
         # 解析图数据库的结果
         db_res = refs.get("graph_base", {}).get("results", {})
         if db_res.get("nodes") and len(db_res["nodes"]) > 0:
-            db_text = "\n".join(
-                [f"{edge['source_name']}和{edge['target_name']}的关系是{edge['type']}" for edge in db_res.get("edges", [])]
-            )
-            external_parts.extend(["图数据库信息:", db_text])
+            relations = dict.fromkeys(f"{edge['source_name']}和{edge['target_name']}的关系是{edge['type']}"
+                                      for edge in db_res.get("edges", []))
+            relations = [{"text": r} for r in relations]
+            if budget is not None:
+                relations, used = select_by_budget(relations, budget)
+                budget -= used
+            if relations:
+                external_parts.extend(["图数据库信息:", "\n".join(r["text"] for r in relations)])
 
         # 解析网络搜索的结果
         web_res = refs.get("web_search", {}).get("results", [])
         if web_res:
-            web_text = "\n".join(f"{r['title']}: {r['content']}" for r in web_res)
-            external_parts.extend(["网络搜索信息:", web_text])
+            snippets = [{"text": f"{r['title']}: {r['content']}", "score": r.get("score", 0.0)} for r in web_res]
+            if budget is not None:
+                snippets, used = select_by_budget(snippets, budget)
+            if snippets:
+                external_parts.extend(["网络搜索信息:", "\n".join(r["text"] for r in snippets)])
 
         # 构造查询
         from src.utils.prompts import knowbase_qa_template
@@ -82,15 +201,36 @@ class Retriever:
     def query_graph(self, query, history, refs):
         results = []
         if refs["meta"].get("use_graph") and config.enable_knowledge_base:
-            for entity in refs["entities"]:
-                if entity == "":
-                    continue
-                result = graph_base.query_node(entity)
-                if result != []:
-                    results.extend(result)
+            # 所有实体在一次查询中完成检索，多个实体共享的关系只返回一次
+            results = graph_base.query_nodes(refs["entities"])
         return {"results": graph_base.format_query_result_to_graph(results)}
 
 
+    def expand_graph_chunks(self, refs):
+        """将图谱检索命中的实体展开为知识库中提及它们的知识块，并按实体重合程度调整知识库结果的排序
+
+        使用入库时建立的实体索引，不额外调用 LLM；需要同时启用知识库与图谱检索，
+        meta 中的 use_graph_chunks 优先于 config.graph_chunk_expansion。
+        """
+        meta = refs["meta"]
+        if not meta.get("use_graph_chunks", config.graph_chunk_expansion) or not meta.get("db_id"):
+            return
+
+        kb_response = refs.get("knowledge_base") or {}
+        graph_nodes = (refs.get("graph_base") or {}).get("results", {}).get("nodes", [])
+        if "results" not in kb_response or not graph_nodes:
+            return
+
+        try:
+            kb_response["results"] = knowledge_base.expand_by_entities(
+                meta["db_id"], kb_response["results"],
+                query_entities=[e.strip() for e in refs.get("entities") or [] if e.strip()],
+                graph_entities=[node["name"] for node in graph_nodes if node.get("name")],
+                top_k=meta.get("topK", 5),
+                boost=config.graph_chunk_boost)
+        except Exception as e:
+            logger.error(f"Graph chunk expansion failed: {e}, {traceback.format_exc()}")
+
     def query_knowledgebase(self, query, history, refs):
         """查询知识库"""
 
@@ -115,6 +255,9 @@ class Retriever:
                                             db_id=db_id,
                                             distance_threshold=meta.get("distanceThreshold", 0.5),
                                             rerank_threshold=meta.get("rerankThreshold", 0.1),
+                                            rerank_batch_size=meta.get("rerankBatchSize"),
+                                            rerank_max_length=meta.get("rerankMaxLength"),
+                                            neighbor_window=meta.get("neighborWindow", 0),
                                             max_query_count=meta.get("maxQueryCount", 10),
                                             top_k=meta.get("topK", 5))
 
@@ -124,6 +267,18 @@ class Retriever:
 
         return response
 
+    async def aquery_knowledgebase(self, query, history, refs):
+        """异步查询知识库，Milvus 检索与重排序在线程池中执行"""
+        meta = refs["meta"]
+        if not meta.get("db_id") or not config.enable_knowledge_base:
+            return self.query_knowledgebase(query, history, refs)
+
+        rw_query = await self.arewrite_query(query, history, refs)
+        # 已经改写过的查询不需要再次改写
+        kb_refs = {**refs, "meta": {**meta, "mode": "search", "use_rewrite_query": "off"}}
+        response = await asyncio.to_thread(self.query_knowledgebase, rw_query, history, kb_refs)
+        return response
+
     def query_web(self, query, history, refs):
         """查询网络"""
 
@@ -138,15 +293,17 @@ class Retriever:
 
         return {"results": search_results}
 
+    def _rewrite_query_span(self, refs):
+        if refs["meta"].get("mode") == "search":  # 比如检索测试中，是否开启重写查询，不同与全局配置，如果是搜索模式，就使用 meta 的配置，否则就使用全局的配置
+            return refs["meta"].get("use_rewrite_query", "off")
+        return config.use_rewrite_query
+
     def rewrite_query(self, query, history, refs):
         """重写查询"""
         model_provider = config.model_provider
         model_name = config.model_name
         model = select_model(model_provider=model_provider, model_name=model_name)
-        if refs["meta"].get("mode") == "search":  # 比如检索测试中，是否开启重写查询，不同与全局配置，如果是搜索模式，就使用 meta 的配置，否则就使用全局的配置
-            rewrite_query_span = refs["meta"].get("use_rewrite_query", "off")
-        else:
-            rewrite_query_span = config.use_rewrite_query
+        rewrite_query_span = self._rewrite_query_span(refs)
 
         if rewrite_query_span == "off":
             return query
@@ -155,10 +312,28 @@ class Retriever:
         # 只提取用户的输入
         history_query = [entry["content"] for entry in history if entry["role"] == "user"] if history else []
         rewritten_query_prompt = rw_template.format(history=history_query, query=query)
-        rewritten_query = model.predict(rewritten_query_prompt).content
+        rewritten_query = model.predict(rewritten_query_prompt, cache=True).content
 
         if rewrite_query_span == "hyde":
-            res = HyDEOperator.call(model_callable=model.predict, query=query, context_str=history_query)
+            res = HyDEOperator.call(model_callable=partial(model.predict, cache=True), query=query, context_str=history_query)
+            rewritten_query = res.content
+
+        return rewritten_query
+
+    async def arewrite_query(self, query, history, refs):
+        """异步重写查询"""
+        rewrite_query_span = self._rewrite_query_span(refs)
+        if rewrite_query_span == "off":
+            return query
+
+        model = select_model(model_provider=config.model_provider, model_name=config.model_name)
+
+        from src.utils.prompts import rewritten_query_prompt_template2 as rw_template
+        history_query = [entry["content"] for entry in history if entry["role"] == "user"] if history else []
+        rewritten_query = (await model.apredict(rw_template.format(history=history_query, query=query), cache=True)).content
+
+        if rewrite_query_span == "hyde":
+            res = await HyDEOperator.call(model_callable=partial(model.apredict, cache=True), query=query, context_str=history_query)
             rewritten_query = res.content
 
         return rewritten_query
@@ -176,12 +351,34 @@ class Retriever:
             # from src.utils.prompts import keywords_prompt_template as entity_templat|e
 
             entity_extraction_prompt = entity_template.format(text=query)
-            entities = model.predict(entity_extraction_prompt).content.split("<->")
+            entities = model.predict(entity_extraction_prompt, cache=True).content.split("<->")
             # entities = [entity for entity in entities if all(char.isalnum() or char in "汉字" for char in entity)]
 
         return entities
 
+    async def areco_entities(self, query, history, refs):
+        """异步识别句子中的实体"""
+        if not refs["meta"].get("use_graph"):
+            return []
+
+        query = refs.get("rewritten_query", query)
+        model = select_model(model_provider=config.model_provider, model_name=config.model_name)
+
+        from src.utils.prompts import entity_extraction_prompt_template as entity_template
+        response = await model.apredict(entity_template.format(text=query), cache=True)
+        return response.content.split("<->")
+
     def __call__(self, query, history, meta):
         refs = self.retrieval(query, history, meta)
         query = self.construct_query(query, refs, meta)
         return query, refs
+
+    async def acall(self, query, history, meta, prefetch_key=None):
+        refs = await self.aretrieval(query, history, meta, prefetch_key=prefetch_key)
+        query = self.construct_query(query, refs, meta)
+        return query, refs
+
+
+def _normalize_query(query):
+    """去掉空白和末尾的标点，用于比较草稿与最终的问题"""
+    return re.sub(r"\s+", "", query).rstrip("?？。.!！")
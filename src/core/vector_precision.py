@@ -0,0 +1,109 @@
+"""
+知识库向量的存储精度
+
+- float32: 默认精度，Milvus FLOAT_VECTOR + COSINE
+- float16: 半精度，Milvus FLOAT16_VECTOR + COSINE，内存占用减半
+- binary:  二值化（按符号位打包），Milvus BINARY_VECTOR + HAMMING，内存占用为 1/32，
+           检索时先按汉明距离召回候选，再使用全精度的查询向量重新打分
+"""
+
+from types import SimpleNamespace
+
+import numpy as np
+from pymilvus import DataType
+
+DEFAULT_PRECISION = "float32"
+SUPPORTED_PRECISIONS = ["float32", "float16", "binary"]
+
+# binary 模式下，召回 limit * BINARY_RESCORE_MULTIPLIER 个候选用于重新打分
+BINARY_RESCORE_MULTIPLIER = 4
+
+# 查询向量与文档符号向量的余弦约为与原始文档向量余弦的 sqrt(2/π) ≈ 0.8 倍（各维近似独立的高斯分布时），
+# 重新打分时除以该比例，使 binary 知识库与 float 知识库使用同一个 distance_threshold 时召回的数量相当
+BINARY_COSINE_SCALE = float(np.sqrt(np.pi / 2))
+
+_FIELD_TYPES = {
+    "float32": DataType.FLOAT_VECTOR,
+    "float16": DataType.FLOAT16_VECTOR,
+    "binary": DataType.BINARY_VECTOR,
+}
+
+_INDEX_PARAMS = {
+    "float32": {"index_type": "AUTOINDEX", "metric_type": "COSINE"},
+    "float16": {"index_type": "AUTOINDEX", "metric_type": "COSINE"},
+    "binary": {"index_type": "BIN_FLAT", "metric_type": "HAMMING"},
+}
+
+
+def check_precision(precision):
+    """校验并返回存储精度，None 表示默认精度"""
+    precision = precision or DEFAULT_PRECISION
+    if precision not in SUPPORTED_PRECISIONS:
+        raise ValueError(f"Unsupported vector precision: {precision}, only support {SUPPORTED_PRECISIONS}")
+    return precision
+
+
+def get_field_type(precision):
+    return _FIELD_TYPES[check_precision(precision)]
+
+
+def get_index_params(precision):
+    return _INDEX_PARAMS[check_precision(precision)].copy()
+
+
+def convert_vectors(vectors, precision):
+    """将 (n, dim) 的向量转换为 Milvus 对应字段类型可以直接插入/检索的格式"""
+    precision = check_precision(precision)
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[None, :]
+
+    if precision == "float32":
+        return matrix
+
+    if precision == "float16":
+        return matrix.astype(np.float16)
+
+    # binary: 按符号位量化后每 8 维打包为 1 个字节
+    packed = np.packbits(matrix > 0, axis=1)
+    return [row.tobytes() for row in packed]
+
+
+def _binary_to_array(value):
+    """Milvus 返回的二值向量可能是 bytes 或者 [bytes]"""
+    if isinstance(value, list | tuple):
+        value = b"".join(bytes(v) for v in value)
+    return np.frombuffer(bytes(value), dtype=np.uint8)
+
+
+def rescore_binary(query_vector, hits, limit):
+    """使用全精度的查询向量对二值向量的候选结果重新打分
+
+    文档向量解包为 ±1 后与查询向量计算余弦，再乘以 BINARY_COSINE_SCALE 还原为原始向量余弦的估计值（截断到 [-1, 1]），
+    以便与 float32/float16 知识库的 distance_threshold 保持一致的语义。
+
+    Args:
+        query_vector: 全精度的查询向量
+        hits: Milvus 检索结果，需要包含 vector 字段
+        limit: 返回的结果数量
+
+    Returns:
+        list: 与 Milvus Hit 一样可以通过 .id / .distance / .entity 访问的结果
+    """
+    if not hits:
+        return []
+
+    query = np.asarray(query_vector, dtype=np.float32)
+    dim = query.shape[0]
+
+    packed = np.stack([_binary_to_array(hit.entity.get("vector")) for hit in hits])
+    signs = np.unpackbits(packed, axis=1)[:, :dim].astype(np.float32) * 2 - 1
+    scores = signs @ query / (np.linalg.norm(query) * np.sqrt(dim) + 1e-12)
+    scores = np.clip(scores * BINARY_COSINE_SCALE, -1.0, 1.0)
+
+    order = np.argsort(-scores)[:limit]
+    results = []
+    for i in order:
+        entity = {k: v for k, v in hits[i].entity.items() if k != "vector"}
+        results.append(SimpleNamespace(id=hits[i].id, distance=float(scores[i]), entity=entity))
+    return results
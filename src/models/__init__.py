@@ -1,22 +1,66 @@
 import os
+import threading
 import traceback
 from src import config
+from src.utils import hashstr
 from src.utils.logging_config import logger
-from src.models.chat_model import OpenAIBase
+from src.models.chat_model import OpenAIBase, get_http_client, get_async_http_client
+from src.models.metrics import instrument_model
+
+# 模型实例缓存，key 为 (provider, model_name, base_url, api_key 指纹)
+# 实例内的 OpenAI / ChatOpenAI 客户端共用 chat_model 中的 HTTP 连接池
+_model_cache = {}
+_model_cache_lock = threading.Lock()
+
+
+def _model_cache_key(model_provider, model_name):
+    """计算模型实例的缓存 key，base_url 或 api_key 变化时 key 也随之变化"""
+    if model_provider == "custom":
+        model_info = next((x for x in config.get("custom_models") or [] if x["custom_id"] == model_name), None) or {}
+        base_url, api_key = model_info.get("api_base"), model_info.get("api_key")
+    elif model_provider == "openai":
+        base_url, api_key = os.getenv("OPENAI_API_BASE"), os.getenv("OPENAI_API_KEY")
+    else:
+        model_info = config.model_names.get(model_provider, {})
+        base_url = model_info.get("base_url") or str(model_info.get("endpoints"))
+        api_key = "|".join(os.getenv(env) or "" for env in model_info.get("env", []))
+
+    return (model_provider, model_name, base_url, hashstr(api_key or "", 16))
+
+
+def clear_model_cache():
+    """配置变化后清空模型实例缓存"""
+    with _model_cache_lock:
+        for model in _model_cache.values():
+            if hasattr(model, "close"):
+                model.close()
+        _model_cache.clear()
+    logger.info("Model instance cache cleared")
 
 
 def select_model(model_provider=None, model_name=None):
-    """根据模型提供者选择模型"""
+    """根据模型提供者选择模型，相同配置的模型实例会被复用"""
     model_provider = model_provider or config.model_provider
     model_info = config.model_names.get(model_provider, {})
     model_name = model_name or config.model_name or model_info.get("default", "")
 
+    if model_provider is None:
+        raise ValueError("Model provider not specified, please modify `model_provider` in `src/config/base.yaml`")
+
+    key = _model_cache_key(model_provider, model_name)
+    if (model := _model_cache.get(key)) is not None:
+        return model
 
-    logger.info(f"Selecting model from `{model_provider}` with `{model_name}`")
+    with _model_cache_lock:
+        if (model := _model_cache.get(key)) is None:
+            model = _model_cache[key] = instrument_model(_load_model(model_provider, model_name), model_provider)
+    return model
 
 
-    if model_provider is None:
-        raise ValueError("Model provider not specified, please modify `model_provider` in `src/config/base.yaml`")
+def _load_model(model_provider, model_name):
+    model_info = config.model_names.get(model_provider, {})
+
+    logger.info(f"Selecting model from `{model_provider}` with `{model_name}`")
 
     if model_provider == "qianfan":
         from src.models.chat_model import Qianfan
@@ -40,6 +84,8 @@ def select_model(model_provider=None, model_name=None):
                 model=model_name,
                 api_key=os.getenv(model_info["env"][0]),
                 base_url=model_info["base_url"],
+                http_client=get_http_client(),
+                http_async_client=get_async_http_client(),
             )
         )
 
@@ -53,9 +99,15 @@ def select_model(model_provider=None, model_name=None):
                 model=model_name,
                 api_key=os.getenv(model_info["env"][0]),
                 base_url=model_info["base_url"],
+                http_client=get_http_client(),
+                http_async_client=get_async_http_client(),
             )
         )
 
+    if model_info.get("endpoints"):
+        from src.models.chat_model import BalancedOpenAI
+        return BalancedOpenAI(model_info, model_name)
+
     if model_provider == "custom":
         model_info = next((x for x in config.custom_models if x["custom_id"] == model_name), None)
         if model_info is None:
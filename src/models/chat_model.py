@@ -1,54 +1,293 @@
 import os
+import json
+import time
+import anyio
+import httpx
+import asyncio
+import threading
 import requests
-from openai import OpenAI
-from src.utils import logger, get_docker_safe_url
+from collections import OrderedDict
+from diskcache import Cache
+from openai import OpenAI, AsyncOpenAI
+from src import config
+from src.utils import logger, hashstr, get_docker_safe_url
+from src.models.metrics import llm_metrics
+from src.models.load_balancer import EndpointPool, RETRYABLE_ERRORS
 from langchain_openai import ChatOpenAI
 
+# 所有模型客户端共用的 HTTP 连接池，避免每次创建客户端都重新建立 TLS 连接
+_HTTP_LIMITS = httpx.Limits(max_connections=200, max_keepalive_connections=50)
+_http_client = None
+_async_http_client = None
+
+
+def get_http_client():
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.Client(limits=_HTTP_LIMITS, timeout=httpx.Timeout(600.0, connect=10.0))
+    return _http_client
+
+
+def get_async_http_client():
+    global _async_http_client
+    if _async_http_client is None:
+        _async_http_client = httpx.AsyncClient(limits=_HTTP_LIMITS, timeout=httpx.Timeout(600.0, connect=10.0))
+    return _async_http_client
+
+
+def to_messages(message):
+    if isinstance(message, str):
+        return [{"role": "user", "content": message}]
+    return message
+
+
+async def iterate_in_thread(iterator):
+    """在线程池中逐个迭代同步迭代器，供不支持异步接口的模型使用"""
+    sentinel = object()
+    try:
+        while (item := await asyncio.to_thread(next, iterator, sentinel)) is not sentinel:
+            yield item
+    finally:
+        if hasattr(iterator, "close"):
+            iterator.close()
+
+
+def get_total_tokens(usage):
+    """兼容 OpenAI（total_tokens）、DashScope（input_tokens + output_tokens）以及 dict 形式的 usage"""
+    if usage is None:
+        return 0
+    get = usage.get if isinstance(usage, dict) else lambda key: getattr(usage, key, None)
+    total = get("total_tokens")
+    if total is None:
+        total = (get("input_tokens") or get("prompt_tokens") or 0) + (get("output_tokens") or get("completion_tokens") or 0)
+    return total or 0
+
+
+class ResponseCache:
+    """非流式 LLM 调用的响应缓存
+
+    - key 为 (模型, 消息, 参数) 的哈希，后端为内存（LRU）或 diskcache，由 llm_cache_backend 配置
+    - 只有调用方显式传入 cache=True 时才使用
+    - 统计命中率和命中时节省的 token 数
+    """
+
+    max_memory_entries = 4096
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._disk = None
+        self.hits = 0
+        self.misses = 0
+        self.saved_tokens = 0
+
+    def make_key(self, key):
+        return hashstr(json.dumps(key, ensure_ascii=False, sort_keys=True, default=str))
+
+    def get(self, key):
+        if config.llm_cache_backend == "disk":
+            return self._get_disk().get(key)
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        ttl = config.llm_cache_ttl
+        if config.llm_cache_backend == "disk":
+            self._get_disk().set(key, value, expire=ttl)
+            return
+
+        with self._lock:
+            self._memory[key] = (time.time() + ttl, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def _get_disk(self):
+        if self._disk is None:
+            self._disk = Cache(os.path.join(config.save_dir, "data", ".llm_cache"))
+        return self._disk
+
+    def _lookup(self, key):
+        cached = self.get(key)
+        with self._lock:
+            if cached is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.saved_tokens += cached[1]
+        return cached
+
+    def get_or_call(self, key, fn):
+        """fn 返回 (message, usage)"""
+        key = self.make_key(key)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached[0]
+
+        message, usage = fn()
+        self.set(key, (message, get_total_tokens(usage)))
+        return message
+
+    async def aget_or_call(self, key, fn):
+        key = self.make_key(key)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached[0]
+
+        message, usage = await fn()
+        self.set(key, (message, get_total_tokens(usage)))
+        return message
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "saved_tokens": self.saved_tokens,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self._disk is not None:
+            self._disk.clear()
+
+
+response_cache = ResponseCache()
+
+
 class OpenAIBase:
+    # 由 select_model 设置，用于按提供商统计调用
+    provider = "unknown"
+
     def __init__(self, api_key, base_url, model_name, chat_open_ai=None, **kwargs):
         self.api_key = api_key
         self.base_url = base_url
-        self.client = OpenAI(api_key=api_key, base_url=base_url)
+        self.client = OpenAI(api_key=api_key, base_url=base_url, http_client=get_http_client())
+        self.async_client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=get_async_http_client())
         self.model_name = model_name
         self.info = kwargs
         self.chat_open_ai = chat_open_ai or ChatOpenAI(model=model_name,
                                        api_key=api_key,
-                                       base_url=base_url)
+                                       base_url=base_url,
+                                       http_client=get_http_client(),
+                                       http_async_client=get_async_http_client())
 
-    def predict(self, message, stream=False):
-        if isinstance(message, str):
-            messages=[{"role": "user", "content": message}]
-        else:
-            messages = message
+    def predict(self, message, stream=False, cache=False):
+        """cache=True 时使用响应缓存，仅用于改写查询、实体识别等结果可复用的调用，流式输出不使用缓存"""
+        messages = to_messages(message)
 
         if stream:
-            return self._stream_response(messages)
+            return self._timed_stream(messages)
+        elif cache:
+            return response_cache.get_or_call(self._cache_key(messages), lambda: self._timed_completion(messages))
         else:
             return self._get_response(messages)
 
-    def _stream_response(self, messages):
+    async def apredict(self, message, cache=False):
+        messages = to_messages(message)
+        if cache:
+            return await response_cache.aget_or_call(self._cache_key(messages), lambda: self._atimed_completion(messages))
+        message, _ = await self._atimed_completion(messages)
+        return message
+
+    def _timed_completion(self, messages):
+        with llm_metrics.timer(self.provider, self.model_name) as timer:
+            message, usage = self._get_completion(messages)
+            timer.set_usage(usage)
+        return message, usage
+
+    async def _atimed_completion(self, messages):
+        with llm_metrics.timer(self.provider, self.model_name) as timer:
+            message, usage = await self._aget_completion(messages)
+            timer.set_usage(usage)
+        return message, usage
+
+    def _timed_stream(self, messages):
+        with llm_metrics.timer(self.provider, self.model_name, stream=True) as timer:
+            for delta in self._stream_response(messages, timer):
+                timer.first_token()
+                yield delta
+
+    def _cache_key(self, messages, **params):
+        return [type(self).__name__, getattr(self, "base_url", None), self.model_name, messages, params]
+
+    def _get_response(self, messages):
+        message, _ = self._timed_completion(messages)
+        return message
+
+    def _stream_response(self, messages, timer=None):
         try:
             response = self.client.chat.completions.create(
                 model=self.model_name,
                 messages=messages,
                 stream=True,
+                stream_options={"include_usage": True},
             )
             for chunk in response:
                     if len(chunk.choices) > 0:
                         yield chunk.choices[0].delta
+                    if getattr(chunk, "usage", None) and timer is not None:
+                        timer.set_usage(chunk.usage)
 
         except Exception as e:
             err = f"Error streaming response: {e}, URL: {self.base_url}, API Key: {self.api_key[:5]}***, Model: {self.model_name}"
             logger.error(err)
             raise Exception(err)
 
-    def _get_response(self, messages):
+    def _get_completion(self, messages):
+        """返回 (message, usage)"""
         response = self.client.chat.completions.create(
             model=self.model_name,
             messages=messages,
             stream=False,
         )
-        return response.choices[0].message
+        return response.choices[0].message, response.usage
+
+    async def _aget_completion(self, messages):
+        response = await self.async_client.chat.completions.create(
+            model=self.model_name,
+            messages=messages,
+            stream=False,
+        )
+        return response.choices[0].message, response.usage
+
+    async def astream(self, message):
+        """异步流式输出；调用方停止迭代（如客户端断开连接）时会关闭上游的流"""
+        with llm_metrics.timer(self.provider, self.model_name, stream=True) as timer:
+            try:
+                response = await self.async_client.chat.completions.create(
+                    model=self.model_name,
+                    messages=to_messages(message),
+                    stream=True,
+                    stream_options={"include_usage": True},
+                )
+            except Exception as e:
+                err = f"Error streaming response: {e}, URL: {self.base_url}, API Key: {self.api_key[:5]}***, Model: {self.model_name}"
+                logger.error(err)
+                raise Exception(err)
+
+            try:
+                async for chunk in response:
+                    if len(chunk.choices) > 0:
+                        timer.first_token()
+                        yield chunk.choices[0].delta
+                    if getattr(chunk, "usage", None):
+                        timer.set_usage(chunk.usage)
+            finally:
+                # 被取消时也要关闭上游连接，停止 LLM 继续生成
+                with anyio.CancelScope(shield=True):
+                    await response.close()
 
     def get_models(self):
         try:
@@ -82,6 +321,111 @@ class CustomModel(OpenAIBase):
         super().__init__(api_key=api_key, base_url=base_url, model_name=model_name)
 
 
+class BalancedOpenAI(OpenAIBase):
+    """多副本部署的 OpenAI 兼容模型（如多个 vLLM 实例），在 models.yaml 中通过 endpoints 配置
+
+    非流式调用失败时换一个副本重试；流式调用只在建立连接失败（尚未输出任何内容）时换副本。
+    LangChain 的 chat_open_ai 不经过负载均衡，固定使用权重最高的副本。
+    """
+
+    def __init__(self, model_info, model_name):
+        self.pool = EndpointPool.from_config(model_info, name=model_name, http_client=get_http_client(),
+                                             async_http_client=get_async_http_client())
+        primary = max(self.pool.endpoints, key=lambda ep: ep.weight)
+        super().__init__(api_key=primary.api_key, base_url=primary.base_url, model_name=model_name)
+
+    def _cache_key(self, messages, **params):
+        # 各副本部署的是同一个模型，缓存在副本之间共享
+        return [type(self).__name__, [ep.base_url for ep in self.pool.endpoints], self.model_name, messages, params]
+
+    def _call(self, create):
+        tried = set()
+        while (endpoint := self.pool.acquire(exclude=tried)) is not None:
+            try:
+                result = create(endpoint)
+            except RETRYABLE_ERRORS as e:
+                self.pool.release(endpoint, error=True)
+                tried.add(endpoint)
+                logger.warning(f"Endpoint {endpoint.base_url} failed, {len(self.pool.endpoints) - len(tried)} left: {e}")
+                if len(tried) == len(self.pool.endpoints):
+                    raise
+                continue
+            except Exception:
+                self.pool.release(endpoint)
+                raise
+            return endpoint, result
+
+    async def _acall(self, create):
+        tried = set()
+        while (endpoint := self.pool.acquire(exclude=tried)) is not None:
+            try:
+                result = await create(endpoint)
+            except RETRYABLE_ERRORS as e:
+                self.pool.release(endpoint, error=True)
+                tried.add(endpoint)
+                logger.warning(f"Endpoint {endpoint.base_url} failed, {len(self.pool.endpoints) - len(tried)} left: {e}")
+                if len(tried) == len(self.pool.endpoints):
+                    raise
+                continue
+            except BaseException:
+                self.pool.release(endpoint)
+                raise
+            return endpoint, result
+
+    def _get_completion(self, messages):
+        endpoint, response = self._call(lambda ep: ep.client.chat.completions.create(
+            model=self.model_name, messages=messages, stream=False))
+        self.pool.release(endpoint)
+        return response.choices[0].message, response.usage
+
+    async def _aget_completion(self, messages):
+        endpoint, response = await self._acall(lambda ep: ep.async_client.chat.completions.create(
+            model=self.model_name, messages=messages, stream=False))
+        self.pool.release(endpoint)
+        return response.choices[0].message, response.usage
+
+    def _stream_response(self, messages, timer=None):
+        endpoint, response = self._call(lambda ep: ep.client.chat.completions.create(
+            model=self.model_name, messages=messages, stream=True, stream_options={"include_usage": True}))
+        error = False
+        try:
+            for chunk in response:
+                if len(chunk.choices) > 0:
+                    yield chunk.choices[0].delta
+                if getattr(chunk, "usage", None) and timer is not None:
+                    timer.set_usage(chunk.usage)
+        except RETRYABLE_ERRORS:
+            error = True
+            raise
+        finally:
+            response.close()
+            self.pool.release(endpoint, error=error)
+
+    async def astream(self, message):
+        messages = to_messages(message)
+        with llm_metrics.timer(self.provider, self.model_name, stream=True) as timer:
+            endpoint, response = await self._acall(lambda ep: ep.async_client.chat.completions.create(
+                model=self.model_name, messages=messages, stream=True, stream_options={"include_usage": True}))
+            error = False
+            try:
+                async for chunk in response:
+                    if len(chunk.choices) > 0:
+                        timer.first_token()
+                        yield chunk.choices[0].delta
+                    if getattr(chunk, "usage", None):
+                        timer.set_usage(chunk.usage)
+            except RETRYABLE_ERRORS:
+                error = True
+                raise
+            finally:
+                with anyio.CancelScope(shield=True):
+                    await response.close()
+                self.pool.release(endpoint, error=error)
+
+    def close(self):
+        self.pool.close()
+
+
 class GeneralResponse:
     def __init__(self, content):
         self.content = content
@@ -98,18 +442,7 @@ class Qianfan(OpenAIBase):
         secret_key = os.getenv("QIANFAN_SECRET_KEY")
         self.client = qianfan.ChatCompletion(ak=access_key, sk=secret_key)
 
-    def predict(self, message, stream=False):
-        if isinstance(message, str):
-            messages=[{"role": "user", "content": message}]
-        else:
-            messages = message
-
-        if stream:
-            return self._stream_response(messages)
-        else:
-            return self._get_response(messages)
-
-    def _stream_response(self, messages):
+    def _stream_response(self, messages, timer=None):
         response = self.client.do(
             model=self.model_name,
             messages=messages,
@@ -118,13 +451,20 @@ class Qianfan(OpenAIBase):
         for chunk in response:
             yield GeneralResponse(chunk["body"]["result"])
 
-    def _get_response(self, messages):
+    def _get_completion(self, messages):
         response = self.client.do(
             model=self.model_name,
             messages=messages,
             stream=False,
         )
-        return GeneralResponse(response["body"]["result"])
+        return GeneralResponse(response["body"]["result"]), response["body"].get("usage")
+
+    async def _aget_completion(self, messages):
+        return await asyncio.to_thread(self._get_completion, messages)
+
+    async def astream(self, message):
+        async for delta in iterate_in_thread(self.predict(message, stream=True)):
+            yield delta
 
 
 
@@ -134,18 +474,7 @@ class DashScope(OpenAIBase):
         self.model_name = model_name
         self.api_key= os.getenv("DASHSCOPE_API_KEY")
 
-    def predict(self, message, stream=False):
-        if isinstance(message, str):
-            messages=[{"role": "user", "content": message}]
-        else:
-            messages = message
-
-        if stream:
-            return self._stream_response(messages)
-        else:
-            return self._get_response(messages)
-
-    def _stream_response(self, messages):
+    def _stream_response(self, messages, timer=None):
         import dashscope
         response = dashscope.Generation.call(
             api_key=self.api_key,
@@ -157,9 +486,11 @@ class DashScope(OpenAIBase):
         for chunk in response:
             message = chunk.output.choices[0].message
             message.is_full = False
+            if timer is not None:
+                timer.set_usage(chunk.usage)
             yield chunk.output.choices[0].message
 
-    def _get_response(self, messages):
+    def _get_completion(self, messages):
         import dashscope
         response = dashscope.Generation.call(
             api_key=self.api_key,
@@ -168,7 +499,14 @@ class DashScope(OpenAIBase):
             result_format='message',
             stream=False,
         )
-        return response.output.choices[0].message
+        return response.output.choices[0].message, response.usage
+
+    async def _aget_completion(self, messages):
+        return await asyncio.to_thread(self._get_completion, messages)
+
+    async def astream(self, message):
+        async for delta in iterate_in_thread(self.predict(message, stream=True)):
+            yield delta
 
 
 if __name__ == "__main__":
@@ -2,6 +2,7 @@ import os
 import json
 import requests
 import asyncio
+import numpy as np
 from abc import abstractmethod
 from zhipuai import ZhipuAI
 from langchain_huggingface import HuggingFaceEmbeddings
@@ -10,8 +11,23 @@ from src import config
 from src.utils import hashstr, logger, get_docker_safe_url
 
 
+def to_matrix(vectors, normalize=False):
+    """将向量转换为 (n, dim) 的 float32 连续数组，normalize 时按行做 L2 归一化"""
+    matrix = np.ascontiguousarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[None, :]
+
+    if normalize:
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+
+    return matrix
+
+
 class BaseEmbeddingModel:
     embed_state = {}
+    # 远程接口返回的向量不一定归一化，统一在 encode 中向量化地做 L2 归一化
+    normalize = True
 
     @abstractmethod
     def predict(self, message):
@@ -27,10 +43,11 @@ class BaseEmbeddingModel:
         return config.embed_model_names[self.model].get("dimension", None)
 
     def encode(self, message):
-        return self.predict(message)
+        """返回 (n, dim) 的 np.ndarray"""
+        return to_matrix(self.predict(message), normalize=self.normalize)
 
     def encode_queries(self, queries):
-        return self.predict(queries)
+        return to_matrix(self.predict(queries), normalize=self.normalize)
 
     async def aencode(self, message):
         return await asyncio.to_thread(self.encode, message)
@@ -42,8 +59,9 @@ class BaseEmbeddingModel:
         return await asyncio.to_thread(self.batch_encode, messages, batch_size)
 
     def batch_encode(self, messages, batch_size=20):
+        """分批编码，结果直接写入预先分配的 (n, dim) float32 数组，避免大量 Python float 对象"""
         logger.info(f"Batch encoding {len(messages)} messages")
-        data = []
+        data = None
 
         if len(messages) > batch_size:
             task_id = hashstr(messages)
@@ -58,15 +76,23 @@ class BaseEmbeddingModel:
             logger.info(f"Encoding {i} to {i+batch_size} with {len(messages)} messages")
             response = self.encode(group_msg)
             # logger.debug(f"Response: {len(response)=}, {len(group_msg)=}, {len(response[0])=}")
-            data.extend(response)
+            if data is None:
+                data = np.empty((len(messages), response.shape[1]), dtype=np.float32)
+            data[i:i+len(group_msg)] = response
 
         if len(messages) > batch_size:
             self.embed_state[task_id]['progress'] = len(messages)
             self.embed_state[task_id]['status'] = 'completed'
 
+        if data is None:
+            data = np.empty((0, self.get_dimension() or 0), dtype=np.float32)
+
         return data
 
 class LocalEmbeddingModel(BaseEmbeddingModel):
+    # encode_kwargs 中已经设置 normalize_embeddings
+    normalize = False
+
     def __init__(self, **kwargs):
         info = config.embed_model_names[config.embed_model]
 
@@ -100,15 +126,15 @@ class LocalEmbeddingModel(BaseEmbeddingModel):
         return self.model.embed_documents(message)
 
     async def aencode(self, message):
-        return await self.model.aembed_documents(message)
+        return to_matrix(await self.model.aembed_documents(message))
 
     def encode_queries(self, queries):
         logger.warning("Huggingface Model 不支持批量 encode queries，因此使用训练实现")
         data = []
         for q in queries:
-            data.append(self.predict(q))
+            data.append(self.predict([q])[0])
 
-        return data
+        return to_matrix(data)
 
 
 class ZhipuEmbedding(BaseEmbeddingModel):
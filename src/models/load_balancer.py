@@ -0,0 +1,159 @@
+"""
+OpenAI 兼容接口的多副本负载均衡
+
+在 models.yaml 中为提供商配置多个 endpoints（例如多个 vLLM 副本）后：
+1. 按 (进行中的请求数 + 1) / weight 选择负载最低的副本
+2. 后台线程定期请求 /models 检查副本是否可用
+3. 连续失败 failure_threshold 次的副本熔断 cooldown 秒，之后放行请求试探是否恢复
+4. 调用方在连接失败、超时、5xx 时换一个副本重试
+"""
+
+import os
+import time
+import threading
+import weakref
+
+import openai
+from openai import OpenAI, AsyncOpenAI
+
+from src.utils.logging_config import logger
+
+# 换副本重试的错误：连接失败、超时、限流和服务端错误；参数错误等换副本也不会成功
+RETRYABLE_ERRORS = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+_pools = weakref.WeakSet()
+
+
+class Endpoint:
+
+    def __init__(self, base_url, api_key, weight=1, http_client=None, async_http_client=None):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.weight = max(float(weight), 0.01)
+        # 由负载均衡负责重试，客户端本身不重试
+        self.client = OpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+        self.async_client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=async_http_client, max_retries=0)
+
+        self.outstanding = 0
+        self.failures = 0
+        self.open_until = 0.0
+        self.healthy = True
+        self.requests = 0
+        self.errors = 0
+
+    def available(self, now):
+        return self.healthy and self.open_until <= now
+
+    def load(self):
+        return (self.outstanding + 1) / self.weight
+
+
+class EndpointPool:
+
+    def __init__(self, endpoints, name=None, failure_threshold=3, cooldown=30, health_check_interval=15):
+        assert endpoints, "At least one endpoint is required"
+        self.name = name
+        self.endpoints = endpoints
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.health_check_interval = health_check_interval
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+        if health_check_interval and len(endpoints) > 1:
+            threading.Thread(target=self._health_check_loop, name="llm-health-check", daemon=True).start()
+        _pools.add(self)
+
+    @classmethod
+    def from_config(cls, model_info, name=None, http_client=None, async_http_client=None):
+        """根据 models.yaml 中提供商的配置创建
+
+        endpoints 的每一项可以单独指定 api_key_env，否则使用提供商 env 中的第一个环境变量
+        """
+        default_key = os.getenv(model_info["env"][0]) if model_info.get("env") else None
+        endpoints = []
+        for item in model_info["endpoints"]:
+            api_key = os.getenv(item["api_key_env"]) if item.get("api_key_env") else default_key
+            endpoints.append(Endpoint(item["base_url"], api_key or "EMPTY", item.get("weight", 1),
+                                      http_client=http_client, async_http_client=async_http_client))
+
+        return cls(endpoints, name=name,
+                   failure_threshold=model_info.get("failure_threshold", 3),
+                   cooldown=model_info.get("cooldown", 30),
+                   health_check_interval=model_info.get("health_check_interval", 15))
+
+    def acquire(self, exclude=()):
+        """选择负载最低的可用副本；全部不可用时选择最早结束熔断的副本，避免直接失败"""
+        now = time.monotonic()
+        with self._lock:
+            candidates = [ep for ep in self.endpoints if ep not in exclude]
+            if not candidates:
+                return None
+
+            available = [ep for ep in candidates if ep.available(now)]
+            if available:
+                endpoint = min(available, key=Endpoint.load)
+            else:
+                endpoint = min(candidates, key=lambda ep: (ep.open_until, ep.load()))
+
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def release(self, endpoint, error=False):
+        with self._lock:
+            endpoint.outstanding -= 1
+            if not error:
+                endpoint.failures = 0
+                endpoint.open_until = 0.0
+                return
+
+            endpoint.errors += 1
+            endpoint.failures += 1
+            if endpoint.failures >= self.failure_threshold:
+                endpoint.open_until = time.monotonic() + self.cooldown
+                logger.warning(f"Endpoint {endpoint.base_url} failed {endpoint.failures} times, "
+                               f"circuit open for {self.cooldown}s")
+
+    def _health_check_loop(self):
+        while not self._stop.wait(self.health_check_interval):
+            for endpoint in self.endpoints:
+                self._check(endpoint)
+
+    def _check(self, endpoint):
+        try:
+            endpoint.client.with_options(timeout=5).models.list()
+            healthy = True
+        except Exception as e:
+            healthy = False
+            logger.debug(f"Health check failed for {endpoint.base_url}: {e}")
+
+        with self._lock:
+            if healthy != endpoint.healthy:
+                logger.info(f"Endpoint {endpoint.base_url} is {'healthy' if healthy else 'unhealthy'}")
+            endpoint.healthy = healthy
+            if healthy and endpoint.open_until:
+                # 健康检查通过后提前结束熔断
+                endpoint.failures = 0
+                endpoint.open_until = 0.0
+
+    def close(self):
+        self._stop.set()
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return [{
+                "base_url": ep.base_url,
+                "weight": ep.weight,
+                "outstanding": ep.outstanding,
+                "requests": ep.requests,
+                "errors": ep.errors,
+                "healthy": ep.healthy,
+                "circuit_open": ep.open_until > now,
+            } for ep in self.endpoints]
+
+
+def get_endpoint_stats():
+    """所有负载均衡模型的副本状态"""
+    return {pool.name: pool.stats() for pool in list(_pools) if pool.name}
@@ -0,0 +1,240 @@
+"""
+LLM 调用的用量与延迟统计
+
+按 (provider, model) 聚合请求数、错误数、输入 / 输出 / 命中前缀缓存的 token 数、总耗时、
+首 token 耗时（TTFT）和输出速度（tokens/sec），可以导出为 JSON 或 Prometheus 文本格式。
+"""
+
+import time
+import asyncio
+import threading
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from src.utils.logging_config import logger
+
+
+def _usage_get(usage, *keys):
+    for key in keys:
+        value = usage.get(key) if isinstance(usage, dict) else getattr(usage, key, None)
+        if value is not None:
+            return value
+    return None
+
+
+def parse_usage(usage):
+    """统一不同提供商的 usage 格式
+
+    Returns:
+        (prompt_tokens, completion_tokens, cached_tokens)，缺失的字段为 None
+    """
+    if usage is None:
+        return None, None, None
+
+    prompt_tokens = _usage_get(usage, "prompt_tokens", "input_tokens")
+    completion_tokens = _usage_get(usage, "completion_tokens", "output_tokens")
+
+    # OpenAI / vLLM（--enable-prompt-tokens-details）: prompt_tokens_details.cached_tokens
+    # DeepSeek: prompt_cache_hit_tokens；LangChain usage_metadata: input_token_details.cache_read
+    cached_tokens = None
+    details = _usage_get(usage, "prompt_tokens_details", "input_token_details")
+    if details is not None:
+        cached_tokens = _usage_get(details, "cached_tokens", "cache_read")
+    if cached_tokens is None:
+        cached_tokens = _usage_get(usage, "prompt_cache_hit_tokens")
+
+    return prompt_tokens, completion_tokens, cached_tokens
+
+
+class LLMMetrics:
+
+    _FIELDS = ("requests", "errors", "stream_requests", "prompt_tokens", "completion_tokens", "cached_tokens",
+               "latency_sum", "ttft_sum", "ttft_count", "generation_time_sum")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, provider, model, latency, ttft=None, prompt_tokens=None, completion_tokens=None,
+               cached_tokens=None, error=False, stream=False):
+        with self._lock:
+            stats = self._stats.setdefault((provider, model), dict.fromkeys(self._FIELDS, 0))
+            stats["requests"] += 1
+            stats["errors"] += int(error)
+            stats["stream_requests"] += int(stream)
+            stats["prompt_tokens"] += prompt_tokens or 0
+            stats["completion_tokens"] += completion_tokens or 0
+            stats["cached_tokens"] += cached_tokens or 0
+            stats["latency_sum"] += latency
+            if ttft is not None:
+                stats["ttft_sum"] += ttft
+                stats["ttft_count"] += 1
+            if completion_tokens:
+                # 输出速度只统计首 token 之后的生成时间
+                stats["generation_time_sum"] += latency - (ttft or 0)
+
+    def timer(self, provider, model, stream=False):
+        return CallTimer(self, provider, model, stream=stream)
+
+    def summary(self):
+        with self._lock:
+            items = [(key, dict(stats)) for key, stats in self._stats.items()]
+
+        result = []
+        for (provider, model), stats in items:
+            requests = stats["requests"]
+            result.append({
+                "provider": provider,
+                "model": model,
+                "requests": requests,
+                "errors": stats["errors"],
+                "error_rate": stats["errors"] / requests if requests else 0.0,
+                "stream_requests": stats["stream_requests"],
+                "prompt_tokens": stats["prompt_tokens"],
+                "completion_tokens": stats["completion_tokens"],
+                "cached_tokens": stats["cached_tokens"],
+                "cached_ratio": stats["cached_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else 0.0,
+                "avg_latency": stats["latency_sum"] / requests if requests else 0.0,
+                "avg_ttft": stats["ttft_sum"] / stats["ttft_count"] if stats["ttft_count"] else None,
+                "tokens_per_sec": (stats["completion_tokens"] / stats["generation_time_sum"]
+                                   if stats["generation_time_sum"] > 0 else None),
+            })
+        return result
+
+    def to_prometheus(self):
+        """导出为 Prometheus 文本格式"""
+        with self._lock:
+            items = [(key, dict(stats)) for key, stats in self._stats.items()]
+
+        metrics = [
+            ("llm_requests_total", "counter", "Number of LLM requests", "requests"),
+            ("llm_errors_total", "counter", "Number of failed LLM requests", "errors"),
+            ("llm_prompt_tokens_total", "counter", "Prompt tokens", "prompt_tokens"),
+            ("llm_completion_tokens_total", "counter", "Completion tokens", "completion_tokens"),
+            ("llm_cached_tokens_total", "counter", "Prompt tokens served from the prefix cache", "cached_tokens"),
+            ("llm_request_duration_seconds_sum", "counter", "Total LLM request duration", "latency_sum"),
+            ("llm_time_to_first_token_seconds_sum", "counter", "Total time to first token of streamed requests", "ttft_sum"),
+            ("llm_time_to_first_token_seconds_count", "counter", "Streamed requests with a first token", "ttft_count"),
+            ("llm_generation_seconds_sum", "counter", "Total generation time after the first token", "generation_time_sum"),
+        ]
+
+        lines = []
+        for name, metric_type, help_text, field in metrics:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for (provider, model), stats in items:
+                labels = f'provider="{_escape_label(provider)}",model="{_escape_label(model)}"'
+                lines.append(f"{name}{{{labels}}} {stats[field]}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class CallTimer:
+    """记录一次调用的耗时，用法：
+
+        with llm_metrics.timer(provider, model, stream=True) as timer:
+            for chunk in response:
+                timer.first_token()
+                ...
+            timer.set_usage(usage)
+    """
+
+    def __init__(self, metrics, provider, model, stream=False):
+        self.metrics = metrics
+        self.provider = provider
+        self.model = model
+        self.stream = stream
+        self.ttft = None
+        self.usage = None
+        self.chunks = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def first_token(self):
+        self.chunks += 1
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self.start
+
+    def set_usage(self, usage):
+        self.usage = usage
+
+    def __exit__(self, exc_type, exc, tb):
+        latency = time.perf_counter() - self.start
+        prompt_tokens, completion_tokens, cached_tokens = parse_usage(self.usage)
+        if completion_tokens is None and self.chunks:
+            # 没有返回 usage 的流式输出，每个数据块近似为一个 token
+            completion_tokens = self.chunks
+
+        # 客户端断开导致的取消不算作错误
+        error = exc_type is not None and not issubclass(exc_type, (GeneratorExit, asyncio.CancelledError))
+        self.metrics.record(self.provider, self.model, latency, ttft=self.ttft if self.stream else None,
+                            prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                            cached_tokens=cached_tokens, error=error, stream=self.stream)
+        if error:
+            logger.warning(f"LLM call failed: {self.provider}/{self.model}, {exc_type.__name__}: {exc}")
+        return False
+
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """LangChain 回调，统计智能体中通过 ChatOpenAI 等发起的调用"""
+
+    def __init__(self, provider, model):
+        self.provider = provider
+        self.model = model
+        self._runs = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._runs[run_id] = {"start": time.perf_counter(), "ttft": None}
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._runs[run_id] = {"start": time.perf_counter(), "ttft": None}
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        run = self._runs.get(run_id)
+        if run is not None and run["ttft"] is None:
+            run["ttft"] = time.perf_counter() - run["start"]
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+
+        usage = None
+        try:
+            usage = response.generations[0][0].message.usage_metadata
+        except (AttributeError, IndexError):
+            pass
+        if usage is None and response.llm_output:
+            usage = response.llm_output.get("token_usage")
+
+        prompt_tokens, completion_tokens, cached_tokens = parse_usage(usage)
+        llm_metrics.record(self.provider, self.model, time.perf_counter() - run["start"], ttft=run["ttft"],
+                           prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                           cached_tokens=cached_tokens, stream=run["ttft"] is not None)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        run = self._runs.pop(run_id, None)
+        if run is not None:
+            llm_metrics.record(self.provider, self.model, time.perf_counter() - run["start"], error=True)
+
+
+def instrument_model(model, provider):
+    """为 select_model 创建的模型实例设置 provider，并为其 LangChain 模型挂载统计回调"""
+    model.provider = provider
+    chat_open_ai = getattr(model, "chat_open_ai", None)
+    if chat_open_ai is not None:
+        callbacks = [cb for cb in (chat_open_ai.callbacks or []) if not isinstance(cb, LLMMetricsCallback)]
+        chat_open_ai.callbacks = [*callbacks, LLMMetricsCallback(provider, model.model_name)]
+    return model
+
+
+llm_metrics = LLMMetrics()
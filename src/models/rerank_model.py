@@ -1,31 +1,123 @@
 import os
 import json
-import requests
+import time
+import asyncio
+import threading
+import httpx
 import numpy as np
-from FlagEmbedding import FlagReranker
 
 from src import config
 from src.utils.logging_config import logger
 
 
-class LocalReranker(FlagReranker):
-    def __init__(self, **kwargs):
+def sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+class BaseReranker:
+    """重排序模型的基类
+
+    compute_score 的输入统一为 [query, [passage1, passage2, ...]]，返回与 passages 一一对应的分数；
+    返回 None 表示重排序未能在时间预算内完成，调用方应保持向量检索的顺序。
+    """
+
+    def compute_score(self, sentence_pairs, batch_size=None, max_length=None, normalize=False):
+        raise NotImplementedError("Subclasses must implement this method")
+
+
+class LocalReranker(BaseReranker):
+    """本地 Cross-Encoder 重排序模型
+
+    - precision: fp32 / fp16 使用 FlagEmbedding 加载；int8 使用 onnxruntime 加载量化后的 ONNX 模型；
+      auto 时 GPU 使用 fp16，CPU 使用 fp32（CPU 上 fp16 反而更慢）
+    - 推理前按 passage 长度排序后再分批，减少 padding 带来的浪费
+    """
+
+    def __init__(self, precision=None, **kwargs):
         model_info = config.reranker_names[config.reranker]
         model_name_or_path = config.model_local_paths.get(model_info["name"], model_info.get("local_path"))
         model_name_or_path = model_name_or_path or model_info["name"]
-        logger.info(f"Loading Reranker model {config.reranker} from {model_name_or_path}")
 
-        super().__init__(model_name_or_path, use_fp16=True, device=config.device, **kwargs)
+        self.precision = resolve_precision(precision or config.reranker_precision)
+        self.batch_size = int(config.reranker_batch_size or 32)
+        self.max_length = int(config.reranker_max_length or 512)
+        logger.info(f"Loading Reranker model {config.reranker} from {model_name_or_path} with precision {self.precision}")
+
+        if self.precision == "int8":
+            self.backend = OnnxRerankerBackend(model_name_or_path, model_info.get("onnx_file", "model_quantized.onnx"))
+        else:
+            self.backend = FlagRerankerBackend(model_name_or_path, use_fp16=self.precision == "fp16", **kwargs)
+
         logger.info(f"Reranker model {config.reranker} loaded")
 
+    def compute_score(self, sentence_pairs, batch_size=None, max_length=None, normalize=False):
+        query, passages = sentence_pairs[0], sentence_pairs[1]
+        if not passages:
+            return []
+
+        batch_size = batch_size or self.batch_size
+        max_length = max_length or self.max_length
+
+        # 按长度倒序分批，同一批内的长度接近
+        order = sorted(range(len(passages)), key=lambda i: len(passages[i]), reverse=True)
+        all_scores = np.empty(len(passages), dtype=np.float32)
+        for start in range(0, len(order), batch_size):
+            batch_idx = order[start:start + batch_size]
+            pairs = [[query, passages[i]] for i in batch_idx]
+            all_scores[batch_idx] = self.backend.score(pairs, max_length)
+
+        if normalize:
+            all_scores = sigmoid(all_scores)
+
+        return all_scores.tolist()
+
+
+class FlagRerankerBackend:
+
+    def __init__(self, model_name_or_path, use_fp16=False, **kwargs):
+        from FlagEmbedding import FlagReranker
+        self.model = FlagReranker(model_name_or_path, use_fp16=use_fp16, device=config.device, **kwargs)
+
+    def score(self, pairs, max_length):
+        scores = self.model.compute_score(pairs, batch_size=len(pairs), max_length=max_length, normalize=False)
+        # 只有一个 pair 时 FlagReranker 返回的是标量
+        return scores if isinstance(scores, list) else [scores]
 
-def sigmoid(x):
-    return 1 / (1 + np.exp(-x))
 
-class SiliconFlowReranker:
+class OnnxRerankerBackend:
+
+    def __init__(self, model_name_or_path, onnx_file):
+        try:
+            from optimum.onnxruntime import ORTModelForSequenceClassification
+            from transformers import AutoTokenizer
+        except ImportError:
+            logger.error("int8 重排序需要安装 optimum 和 onnxruntime：pip install -e '.[onnx]'")
+            raise ImportError("int8 reranker requires optimum[onnxruntime], install it with `pip install -e '.[onnx]'`")
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name_or_path)
+        self.model = ORTModelForSequenceClassification.from_pretrained(model_name_or_path, file_name=onnx_file)
+
+    def score(self, pairs, max_length):
+        inputs = self.tokenizer(pairs, padding=True, truncation=True, max_length=max_length, return_tensors="np")
+        logits = self.model(**inputs).logits
+        return np.asarray(logits, dtype=np.float32).reshape(len(pairs), -1)[:, 0]
+
+
+class SiliconFlowReranker(BaseReranker):
+    """SiliconFlow 远程重排序
+
+    - 使用一个后台事件循环上的 httpx.AsyncClient，复用连接池，同步和异步调用方共享
+    - 候选较多时按 batch_size 切分为多个请求并发发送
+    - 单个请求失败时指数退避重试；整体耗时超过 reranker_latency_budget 时放弃重排序
+    """
+
+    max_retries = 2
+    retry_backoff = 0.2
+
     def __init__(self, **kwargs):
         self.url = "https://api.siliconflow.cn/v1/rerank"
         self.model = config.reranker_names[config.reranker]["name"]
+        self.latency_budget = float(config.reranker_latency_budget or 3)
 
         api_key = os.getenv("SILICONFLOW_API_KEY")
         assert api_key, "SILICONFLOW_API_KEY is required"
@@ -34,22 +126,60 @@ class SiliconFlowReranker:
             "Content-Type": "application/json"
         }
 
-    def compute_score(self, sentence_pairs, batch_size = 256, max_length = 512, normalize = False):
-        # TODO 还没实现 batch_size
+        self.client = httpx.AsyncClient(
+            headers=self.headers,
+            timeout=httpx.Timeout(self.latency_budget, connect=min(self.latency_budget, 3.0)),
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+        )
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="reranker-client", daemon=True).start()
+
+    def compute_score(self, sentence_pairs, batch_size = 64, max_length = 512, normalize = False):
+        future = asyncio.run_coroutine_threadsafe(
+            self._compute_score(sentence_pairs, batch_size, max_length, normalize), self._loop)
+        return future.result()
+
+    async def _compute_score(self, sentence_pairs, batch_size, max_length, normalize):
         query, sentences = sentence_pairs[0], sentence_pairs[1]
-        payload = self.build_payload(query, sentences, max_length)
-        response = requests.request("POST", self.url, json=payload, headers=self.headers)
-        response = json.loads(response.text)
-        # logger.debug(f"SiliconFlow Reranker response: {response}")
+        if not sentences:
+            return []
+
+        batch_size = batch_size or 64
+        chunks = [sentences[i:i + batch_size] for i in range(0, len(sentences), batch_size)]
+        try:
+            chunk_scores = await asyncio.wait_for(
+                asyncio.gather(*[self._request(query, chunk, max_length or 512) for chunk in chunks]),
+                timeout=self.latency_budget,
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"SiliconFlow Reranker 超过时间预算 {self.latency_budget}s，保持向量检索顺序")
+            return None
+        except Exception as e:
+            logger.error(f"SiliconFlow Reranker 请求失败，保持向量检索顺序: {e}")
+            return None
 
-        results = sorted(response["results"], key=lambda x: x["index"])
-        all_scores = [result["relevance_score"] for result in results]
+        all_scores = [score for scores in chunk_scores for score in scores]
 
         if normalize:
-            all_scores = [sigmoid(score) for score in all_scores]
+            all_scores = sigmoid(np.asarray(all_scores)).tolist()
 
         return all_scores
 
+    async def _request(self, query, sentences, max_length):
+        payload = self.build_payload(query, sentences, max_length)
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self.client.post(self.url, json=payload)
+                response.raise_for_status()
+                # logger.debug(f"SiliconFlow Reranker response: {response.text}")
+                results = sorted(response.json()["results"], key=lambda x: x["index"])
+                return [result["relevance_score"] for result in results]
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                retryable = not isinstance(e, httpx.HTTPStatusError) or e.response.status_code in (429, 500, 502, 503, 504)
+                if not retryable or attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(self.retry_backoff * 2 ** attempt)
+
     def build_payload(self, query, sentences, max_length = 512):
         return {
             "model": self.model,
@@ -58,6 +188,16 @@ class SiliconFlowReranker:
             "max_chunks_per_doc": max_length,
         }
 
+
+def resolve_precision(precision):
+    """auto 时根据设备选择精度"""
+    if precision in (None, "", "auto"):
+        return "fp16" if config.device == "cuda" else "fp32"
+    if precision not in ("fp32", "fp16", "int8"):
+        raise ValueError(f"Unsupported reranker precision: {precision}, only support auto/fp32/fp16/int8")
+    return precision
+
+
 def get_reranker():
     support_rerankers = config.reranker_names.keys()
     assert config.reranker in support_rerankers, f"Unsupported Reranker: {config.reranker}, only support {support_rerankers}"
@@ -69,3 +209,38 @@ def get_reranker():
     else:
         raise ValueError(f"Unsupported Reranker: {config.reranker}, only support {config.reranker_names.keys()}")
 
+
+def benchmark_local_reranker(precisions=("fp32", "fp16", "int8"), num_pairs=256, passage_length=300, batch_size=None, max_length=None):
+    """测试本地重排序模型在不同精度下的吞吐（pairs/sec）
+
+    Returns:
+        dict: {precision: pairs_per_sec}，加载失败的精度记录为 None
+    """
+    rng = np.random.default_rng(0)
+    words = ["油气", "水井", "措施", "效果", "评价", "方法", "钻井", "工程", "地层", "压力"]
+    query = "水井措施效果如何评价"
+    # 随机长度的 passage，更贴近真实的检索结果分布
+    passages = ["".join(rng.choice(words, size=int(rng.integers(passage_length // 4, passage_length // 2))))
+                for _ in range(num_pairs)]
+
+    results = {}
+    for precision in precisions:
+        try:
+            reranker = LocalReranker(precision=precision)
+        except Exception as e:
+            logger.warning(f"Skip reranker precision {precision}: {e}")
+            results[precision] = None
+            continue
+
+        reranker.compute_score([query, passages[:8]], batch_size=batch_size, max_length=max_length)  # warmup
+        start = time.perf_counter()
+        reranker.compute_score([query, passages], batch_size=batch_size, max_length=max_length)
+        elapsed = time.perf_counter() - start
+        results[precision] = num_pairs / elapsed
+        logger.info(f"Reranker {config.reranker} [{precision}] {results[precision]:.1f} pairs/sec")
+
+    return results
+
+
+if __name__ == "__main__":
+    print(json.dumps(benchmark_local_reranker(), indent=2))
@@ -96,6 +96,39 @@ def migrate_knowledge_db():
         logger.error(f"数据库迁移失败: {str(e)}")
         return False
 
+def migrate_node_chunk_idx():
+    """
+    为 knowledge_nodes 表添加 chunk_idx 列和 (file_id, chunk_idx) 索引，并从 meta_info 回填
+
+    Returns:
+        bool: 是否执行了迁移
+    """
+    server_db_path = os.path.join(config.save_dir, "data", "server.db")
+    if not os.path.exists(server_db_path):
+        return False
+
+    conn = sqlite3.connect(server_db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("PRAGMA table_info(knowledge_nodes);")
+        columns = [col[1] for col in cursor.fetchall()]
+        if not columns or "chunk_idx" in columns:
+            return False
+
+        logger.info("正在为 knowledge_nodes 添加 chunk_idx 列...")
+        cursor.execute("ALTER TABLE knowledge_nodes ADD COLUMN chunk_idx INTEGER;")
+        cursor.execute("UPDATE knowledge_nodes SET chunk_idx = json_extract(meta_info, '$.chunk_idx');")
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_knowledge_nodes_file_chunk ON knowledge_nodes (file_id, chunk_idx);")
+        conn.commit()
+        logger.info("knowledge_nodes 的 chunk_idx 迁移完成")
+        return True
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"knowledge_nodes 的 chunk_idx 迁移失败: {str(e)}")
+        return False
+    finally:
+        conn.close()
+
 if __name__ == "__main__":
     # 当作为脚本运行时执行迁移
     result = migrate_knowledge_db()
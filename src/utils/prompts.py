@@ -1,7 +1,42 @@
 from datetime import datetime
 
+from langchain_core.messages import BaseMessage, HumanMessage
+
+# 为了命中推理服务（vLLM、OpenAI、DeepSeek 等）的前缀缓存，消息按「静态在前、易变在后」组装：
+# 系统提示词、工具定义、历史对话保持逐字节一致，当前时间、检索到的资料等易变内容只放在最后一条消息中。
+
+DEFAULT_SYSTEM_PROMPT = "你是一个乐于助人的智能助手。"
+
+
 def get_system_prompt():
-    return (f"当前时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+    """静态的系统提示词，不包含时间等易变内容"""
+    return DEFAULT_SYSTEM_PROMPT
+
+
+def get_time_prompt():
+    return f"当前时间：{datetime.now().strftime('%Y-%m-%d %H:%M')}"
+
+
+def append_volatile(messages, volatile):
+    """将易变内容追加到消息列表的末尾，不修改传入的消息
+
+    消息可以是 {"role", "content"} 字典或 LangChain 的 BaseMessage。最后一条是用户消息时追加到其内容之后，
+    否则（如工具调用的结果）追加一条用户消息；不追加系统消息，很多模型模板只允许系统消息出现在开头。
+    """
+    if not volatile:
+        return list(messages)
+
+    messages = list(messages)
+    last = messages[-1] if messages else None
+    if isinstance(last, dict) and last.get("role") == "user" and isinstance(last.get("content"), str):
+        messages[-1] = {**last, "content": f"{last['content']}\n\n{volatile}"}
+    elif isinstance(last, HumanMessage) and isinstance(last.content, str):
+        messages[-1] = last.model_copy(update={"content": f"{last.content}\n\n{volatile}"})
+    elif isinstance(last, BaseMessage):
+        messages.append(HumanMessage(content=volatile))
+    else:
+        messages.append({"role": "user", "content": volatile})
+    return messages
 
 
 knowbase_qa_template = """
@@ -68,6 +103,16 @@ rewritten_query_prompt_template2 = """
 """
 
 
+history_summary_prompt_template = """
+请将以下对话内容总结为一段简洁的摘要，保留用户关心的问题、关键事实和结论，用于后续对话的上下文。只返回摘要内容。
+
+<已有摘要>{summary}</已有摘要>
+<对话内容>
+{dialog}
+</对话内容>
+"""
+
+
 entity_extraction_prompt_template = """
 <指令>请对以下文本进行命名实体识别，返回识别出的实体及其类型。<指令>
 <禁止>1.绝对不能自己编造无关内容,若不存在实体，则直接返回空内容，不要包含内容东西
@@ -0,0 +1,68 @@
+from src.core.context_packing import merge_adjacent, merge_overlap, select_by_budget
+
+
+def chunk(node_id, file_id, chunk_idx, text, start, distance=0.5):
+    return {"id": node_id, "distance": distance,
+            "entity": {"file_id": file_id, "chunk_idx": chunk_idx, "text": text,
+                       "start_char_idx": start, "end_char_idx": start + len(text)}}
+
+
+def test_merge_overlap_by_offsets():
+    assert merge_overlap("abcdef", "defghi", left_end=6, right_start=3) == "abcdefghi"
+
+
+def test_merge_overlap_without_offsets_concatenates():
+    assert merge_overlap("abcdef", "defghi") == "abcdefdefghi"
+
+
+def test_merge_overlap_keeps_repeated_punctuation():
+    # 相邻但不重叠的块，结尾与开头相同的字符不能被当作重叠删除
+    assert merge_overlap("你好。", "。再见", left_end=3, right_start=3) == "你好。。再见"
+
+
+def test_merge_overlap_ignores_offsets_inconsistent_with_text():
+    assert merge_overlap("abcdef", "xyzghi", left_end=6, right_start=3) == "abcdefxyzghi"
+
+
+def test_merge_adjacent_merges_consecutive_chunks():
+    text = "第一段内容。第二段内容。第三段内容。"
+    results = [
+        chunk("c2", "f1", 2, text[10:], 10, distance=0.7),
+        chunk("c0", "f1", 0, text[:8], 0, distance=0.6),
+        chunk("c1", "f1", 1, text[4:12], 4, distance=0.4),
+        chunk("d0", "f2", 5, "另一个文件", 0, distance=0.3),
+        {"id": "x", "distance": 0.2, "entity": {"text": "没有位置信息"}},
+    ]
+
+    passages = {p["id"]: p for p in merge_adjacent(results)}
+
+    assert passages["c0"]["text"] == text
+    assert passages["c0"]["ids"] == ["c0", "c1", "c2"]
+    assert passages["c0"]["score"] == 0.7
+    assert passages["d0"]["text"] == "另一个文件"
+    assert passages["x"]["ids"] == ["x"]
+
+
+def test_merge_adjacent_keeps_gaps_separate():
+    results = [chunk("c0", "f1", 0, "甲乙丙", 0), chunk("c3", "f1", 3, "丁戊己", 30)]
+    assert [p["ids"] for p in merge_adjacent(results)] == [["c0"], ["c3"]]
+
+
+def test_select_by_budget_skips_items_over_budget():
+    items = [
+        {"text": "一二三", "score": 0.9},
+        {"text": "四五六七", "score": 0.8},
+        {"text": "八九", "score": 0.7},
+    ]
+
+    selected, used = select_by_budget(items, 5)
+
+    assert [item["text"] for item in selected] == ["一二三", "八九"]
+    assert used == 5
+
+
+def test_select_by_budget_orders_by_score():
+    items = [{"text": "低", "score": 0.1}, {"text": "高", "score": 0.9}]
+    selected, used = select_by_budget(items, 10)
+    assert [item["text"] for item in selected] == ["高", "低"]
+    assert used == 2
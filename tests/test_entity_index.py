@@ -0,0 +1,51 @@
+import pytest
+
+from src.core.entity_index import EntityMatcher, entity_weights, rank_by_entity_overlap
+
+
+def test_entity_matcher():
+    matcher = EntityMatcher(["贾宝玉", "宝玉", "林黛玉", "玉", ""])
+
+    assert len(matcher) == 3
+    assert matcher.match("贾宝玉和林黛玉在大观园") == {"贾宝玉", "宝玉", "林黛玉"}
+    assert matcher.match("") == set()
+
+
+def test_entity_weights():
+    assert entity_weights(["贾宝玉"], ["贾宝玉", "林黛玉"]) == {"贾宝玉": 1.0, "林黛玉": 0.5}
+
+
+def test_rank_by_entity_overlap_boosts_mentions():
+    results = [{"id": 1, "distance": 0.5}, {"id": 2, "distance": 0.25}]
+    node_entities = {2: {"贾宝玉"}}
+
+    ranked = rank_by_entity_overlap(results, node_entities, {"贾宝玉": 1.0}, boost=0.5)
+
+    assert [r["id"] for r in ranked] == [2, 1]
+    assert ranked[0]["distance"] == 0.75
+    assert ranked[0]["entity_overlap"] == {"entities": ["贾宝玉"], "score": 1.0}
+    assert ranked[1]["entity_overlap"] == {"entities": [], "score": 0}
+
+
+def test_rank_by_entity_overlap_adds_expanded_chunks_after_hits():
+    results = [{"id": 1, "distance": 0.5}, {"id": 2, "distance": 0.25}]
+    node_entities = {2: {"贾宝玉"}, 3: {"林黛玉"}, 4: set()}
+    extra = {3: {"id": 3}, 4: {"id": 4}}
+
+    ranked = rank_by_entity_overlap(results, node_entities, {"贾宝玉": 1.0, "林黛玉": 0.5}, boost=0.5, extra=extra)
+
+    # 展开的知识块以最低分为基准加分，与命中的知识块同分时排在后面；没有重合的展开块不加入
+    assert [r["id"] for r in ranked] == [2, 1, 3]
+    assert ranked[2]["distance"] == 0.5
+
+
+def test_rank_by_entity_overlap_uses_hit_ids_and_rerank_score():
+    results = [{"id": 1, "rerank_score": 0.4, "hit_ids": [1, 5]}, {"id": 2, "rerank_score": 0.5}]
+    ranked = rank_by_entity_overlap(results, {5: {"贾宝玉"}}, {"贾宝玉": 1.0}, boost=0.2)
+    assert ranked[0]["id"] == 1
+    assert ranked[0]["rerank_score"] == pytest.approx(0.6)
+
+
+def test_rank_by_entity_overlap_without_overlap_keeps_results():
+    results = [{"id": 1, "distance": 0.5}]
+    assert rank_by_entity_overlap(results, {}, {"贾宝玉": 1.0}) is results
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from src.core.graph_store import EmbeddedGraphStore
+
+TRIPLES = [
+    {"h": "贾宝玉", "r": "表兄妹", "t": "林黛玉"},
+    {"h": "贾母", "r": "外祖母", "t": "林黛玉"},
+    {"h": "贾母", "r": "祖母", "t": "贾宝玉"},
+    {"h": "林黛玉", "r": "居所", "t": "潇湘馆"},
+]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = EmbeddedGraphStore(str(tmp_path))
+    store.add_triples(TRIPLES)
+    return store
+
+
+def names(store, edge_ids):
+    return {(start._properties["name"], rel._properties["type"], end._properties["name"])
+            for start, rel, end in store.triples(edge_ids)}
+
+
+def test_add_triples_skips_duplicates(store):
+    assert store.add_triples(TRIPLES[:1] + [{"h": "贾宝玉", "r": "居所", "t": "怡红院"}]) == 1
+    assert store.edge_count() == 5
+
+
+def test_add_is_visible_before_explicit_flush(store):
+    # 查询前自动 flush
+    baoyu = store.name_index["贾宝玉"]
+    assert names(store, store.expand([baoyu], hops=1)) == {
+        ("贾宝玉", "表兄妹", "林黛玉"), ("贾母", "祖母", "贾宝玉")}
+
+
+def test_expand_hops_and_filters(store):
+    baoyu = store.name_index["贾宝玉"]
+
+    assert len(store.expand([baoyu], hops=2)) == 4
+    assert names(store, store.expand([baoyu], hops=2, directed=True)) == {
+        ("贾宝玉", "表兄妹", "林黛玉"), ("林黛玉", "居所", "潇湘馆")}
+    assert names(store, store.expand([baoyu], hops=2, rel_types=["表兄妹"])) == {("贾宝玉", "表兄妹", "林黛玉")}
+    assert len(store.expand([baoyu], hops=2, limit=1)) == 1
+
+
+def test_flush_persists(store, tmp_path):
+    store.flush()
+    reloaded = EmbeddedGraphStore(str(tmp_path))
+
+    assert reloaded.edge_count() == 4
+    assert names(reloaded, range(4)) == {(t["h"], t["r"], t["t"]) for t in TRIPLES}
+
+
+def test_delete_entity(store, tmp_path):
+    store.flush()
+    store.delete("林黛玉")
+
+    assert "林黛玉" not in store.name_index
+    assert names(store, range(store.edge_count())) == {("贾母", "祖母", "贾宝玉")}
+    assert store.expand([store.name_index["贾宝玉"]], hops=2) != []
+    assert EmbeddedGraphStore(str(tmp_path)).edge_count() == 1
+
+
+def test_delete_all(store):
+    store.delete()
+    assert store.edge_count() == 0
+    assert store.name_index == {}
+
+
+def test_find_nodes_and_rel_types(store):
+    assert [store.names[i] for i in store.find_nodes("贾")] == ["贾宝玉", "贾母"]
+    assert [store.names[i] for i in store.nodes_with_rel_type("外祖母")] == ["贾母"]
+    assert store.nodes_with_rel_type("不存在") == []
+
+
+def test_embeddings_search(store):
+    vectors = np.eye(len(store.names), dtype=np.float32)
+    store.set_embeddings([{"name": name, "embedding": vectors[i]} for i, name in enumerate(store.names)])
+
+    assert store.nodes_without_embedding() == []
+    assert store.search(vectors[[2]], top_k=1, threshold=0.9) == [2]
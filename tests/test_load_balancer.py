@@ -0,0 +1,95 @@
+from types import SimpleNamespace
+
+import pytest
+
+from src.models import load_balancer
+from src.models.load_balancer import Endpoint, EndpointPool
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(load_balancer, "time", SimpleNamespace(monotonic=lambda: now.value))
+    return now
+
+
+@pytest.fixture
+def pool():
+    endpoints = [Endpoint("http://replica-a/v1", "EMPTY"), Endpoint("http://replica-b/v1", "EMPTY")]
+    return EndpointPool(endpoints, failure_threshold=2, cooldown=30, health_check_interval=0)
+
+
+def fail(pool, endpoint, times):
+    for _ in range(times):
+        endpoint.outstanding += 1
+        pool.release(endpoint, error=True)
+
+
+def test_acquire_prefers_least_loaded(pool):
+    first = pool.acquire()
+    second = pool.acquire()
+    assert first is not second
+    pool.release(first)
+    assert pool.acquire() is first
+
+
+def test_circuit_opens_after_consecutive_failures(pool, clock):
+    a, b = pool.endpoints
+
+    fail(pool, a, 1)
+    assert a.available(clock.value)
+    fail(pool, a, 1)
+    assert not a.available(clock.value)
+
+    # 熔断期间即使 b 的负载更高也选择 b
+    b.outstanding = 10
+    assert pool.acquire() is b
+    assert pool.stats()[0]["circuit_open"]
+
+
+def test_circuit_recovers_after_cooldown(pool, clock):
+    a, b = pool.endpoints
+    fail(pool, a, 2)
+    b.outstanding = 10
+
+    clock.value += 31
+    endpoint = pool.acquire()
+    assert endpoint is a
+
+    # 试探请求成功后清除失败计数
+    pool.release(endpoint)
+    assert a.failures == 0 and a.open_until == 0.0
+
+
+def test_success_resets_failure_count(pool, clock):
+    a, _ = pool.endpoints
+    fail(pool, a, 1)
+    a.outstanding += 1
+    pool.release(a)
+    fail(pool, a, 1)
+    assert a.available(clock.value)
+
+
+def test_all_open_picks_earliest_recovery(pool, clock):
+    a, b = pool.endpoints
+    fail(pool, a, 2)
+    clock.value += 10
+    fail(pool, b, 2)
+    assert pool.acquire() is a
+
+
+def test_acquire_excludes_tried_endpoints(pool):
+    a, b = pool.endpoints
+    assert pool.acquire(exclude=(a,)) is b
+    assert pool.acquire(exclude=(a, b)) is None
+
+
+def test_health_check_closes_circuit(pool, clock):
+    a, _ = pool.endpoints
+    fail(pool, a, 2)
+    a.client = SimpleNamespace(with_options=lambda **kwargs: SimpleNamespace(
+        models=SimpleNamespace(list=lambda: [])))
+
+    pool._check(a)
+
+    assert a.available(clock.value)
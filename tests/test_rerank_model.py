@@ -0,0 +1,42 @@
+import pytest
+
+from src.models.rerank_model import LocalReranker, sigmoid
+
+
+class LengthBackend:
+    """按 passage 长度打分，并记录每一批的输入"""
+
+    def __init__(self):
+        self.batches = []
+
+    def score(self, pairs, max_length):
+        self.batches.append([passage for _, passage in pairs])
+        return [float(len(passage)) for _, passage in pairs]
+
+
+@pytest.fixture
+def reranker():
+    reranker = LocalReranker.__new__(LocalReranker)
+    reranker.backend = LengthBackend()
+    reranker.batch_size = 2
+    reranker.max_length = 512
+    return reranker
+
+
+def test_local_reranker_scores_follow_input_order(reranker):
+    passages = ["bb", "a", "dddd", "ccc", "eeeee"]
+
+    scores = reranker.compute_score(["query", passages])
+
+    assert scores == [2.0, 1.0, 4.0, 3.0, 5.0]
+    # 分批时按长度倒序，同一批内的长度接近
+    assert reranker.backend.batches == [["eeeee", "dddd"], ["ccc", "bb"], ["a"]]
+
+
+def test_local_reranker_normalize(reranker):
+    scores = reranker.compute_score(["query", ["a", "bb"]], normalize=True)
+    assert scores == pytest.approx([sigmoid(1.0), sigmoid(2.0)])
+
+
+def test_local_reranker_empty_passages(reranker):
+    assert reranker.compute_score(["query", []]) == []
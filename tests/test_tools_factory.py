@@ -0,0 +1,24 @@
+from src import graph_base
+from src.agents.tools_factory import query_knowledge_graph
+from src.core.graphbase import Node, Relationship
+
+
+def test_query_knowledge_graph_returns_entity_names(monkeypatch):
+    baoyu, daiyu, jiamu = Node("n1", "贾宝玉"), Node("n2", "林黛玉"), Node("n3", "贾母")
+    paths = [
+        [baoyu, [Relationship("r1", "RELATION", baoyu, daiyu, {"type": "表兄妹"})], daiyu],
+        [baoyu, [Relationship("r1", "RELATION", baoyu, daiyu, {"type": "表兄妹"}),
+                 Relationship("r2", "RELATION", jiamu, daiyu, {"type": "外祖母"})], jiamu],
+    ]
+    monkeypatch.setattr(graph_base, "query_node", lambda *args, **kwargs: paths)
+
+    output = query_knowledge_graph.invoke({"query": "贾宝玉"})
+
+    assert output.splitlines() == ["贾宝玉和林黛玉的关系是表兄妹", "贾母和林黛玉的关系是外祖母"]
+    assert "object at 0x" not in output
+
+
+def test_node_and_relationship_repr():
+    baoyu, daiyu = Node("n1", "贾宝玉"), Node("n2", "林黛玉")
+    assert repr(baoyu) == "Node('贾宝玉')"
+    assert repr(Relationship("r1", "表兄妹", baoyu, daiyu)) == "(贾宝玉)-[表兄妹]->(林黛玉)"
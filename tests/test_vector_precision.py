@@ -0,0 +1,90 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from src.core.vector_precision import check_precision, convert_vectors, rescore_binary
+
+DIM = 1024
+
+
+def unit(vector):
+    return vector / np.linalg.norm(vector)
+
+
+def with_cosine(query, cosine, rng):
+    """构造与 query 的余弦为 cosine 的单位向量"""
+    noise = rng.standard_normal(query.shape[0])
+    noise = unit(noise - noise @ query * query)
+    return cosine * query + np.sqrt(1 - cosine ** 2) * noise
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
+
+
+def test_check_precision():
+    assert check_precision(None) == "float32"
+    with pytest.raises(ValueError):
+        check_precision("int4")
+
+
+def test_convert_vectors_float(rng):
+    vectors = rng.standard_normal((3, 16))
+    assert convert_vectors(vectors, "float32").dtype == np.float32
+    converted = convert_vectors(vectors, "float16")
+    assert converted.dtype == np.float16
+    np.testing.assert_allclose(converted, vectors, rtol=1e-3, atol=1e-3)
+    assert convert_vectors(vectors[0], "float32").shape == (1, 16)
+
+
+def test_convert_vectors_binary_round_trip(rng):
+    vectors = rng.standard_normal((3, 20))
+
+    packed = convert_vectors(vectors, "binary")
+
+    assert all(isinstance(row, bytes) and len(row) == 3 for row in packed)
+    bits = np.unpackbits(np.frombuffer(packed[1], dtype=np.uint8))[:20]
+    np.testing.assert_array_equal(bits.astype(bool), vectors[1] > 0)
+
+
+def make_hits(documents):
+    packed = convert_vectors(np.asarray(documents), "binary")
+    return [SimpleNamespace(id=i, distance=0, entity={"vector": vector, "text": f"doc{i}"})
+            for i, vector in enumerate(packed)]
+
+
+def test_rescore_binary_ranks_by_cosine(rng):
+    query = unit(rng.standard_normal(DIM))
+    cosines = [0.3, 0.9, 0.6]
+    hits = make_hits([with_cosine(query, c, rng) for c in cosines])
+
+    results = rescore_binary(query, hits, limit=2)
+
+    assert [r.id for r in results] == [1, 2]
+    assert results[0].entity == {"text": "doc1"}
+
+
+def test_rescore_binary_scores_match_float_cosine(rng):
+    # 二值化后的分数与 float 知识库的余弦在同一量级，可以共用 distance_threshold
+    query = unit(rng.standard_normal(DIM))
+    cosines = [0.3, 0.5, 0.7, 0.9]
+    hits = make_hits([with_cosine(query, c, rng) for c in cosines])
+
+    scores = {r.id: r.distance for r in rescore_binary(query, hits, limit=len(hits))}
+
+    for i, cosine in enumerate(cosines):
+        assert scores[i] == pytest.approx(cosine, abs=0.08)
+    assert max(scores.values()) <= 1.0
+
+
+def test_rescore_binary_accepts_list_of_bytes(rng):
+    query = unit(rng.standard_normal(DIM))
+    hits = make_hits([query])
+    hits[0].entity["vector"] = [hits[0].entity["vector"]]
+    assert rescore_binary(query, hits, limit=1)[0].distance == pytest.approx(1.0, abs=0.08)
+
+
+def test_rescore_binary_empty():
+    assert rescore_binary(np.ones(8), [], limit=5) == []
@@ -25,6 +25,24 @@ export const chatApi = {
     })
   },
 
+  /**
+   * 输入过程中预检索知识库
+   * @param {Object} params - 与聊天请求相同的参数（query 为当前草稿）
+   * @param {AbortSignal} signal - 用于中断请求的信号控制器
+   * @returns {Promise} - 预检索结果
+   */
+  prefetch: (params, signal) => {
+    return fetch('/api/chat/prefetch', {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        ...useUserStore().getAuthHeaders()
+      },
+      body: JSON.stringify(params),
+      signal
+    })
+  },
+
   /**
    * 发送可中断的聊天消息
    * @param {Object} params - 聊天参数